@@ -0,0 +1,120 @@
+import numpy
+
+from models.classes.case_table import CaseTable
+
+
+# Lower left corner of the synthetic extents, in EPSG:3857 (near the test data in tests/test_data)
+EXTENT_ORIGIN_X = 1820000.0
+EXTENT_ORIGIN_Y = 2120000.0
+
+
+def get_extent(extent_size):
+    """
+    Returns (extent_min_x, extent_min_y, extent_max_x, extent_max_y) of a square extent of
+    extent_size meters. Like the extent parameters of generate_risk, these are the
+    north-west and the south-east corner.
+    """
+    return (EXTENT_ORIGIN_X,
+            EXTENT_ORIGIN_Y + extent_size,
+            EXTENT_ORIGIN_X + extent_size,
+            EXTENT_ORIGIN_Y)
+
+
+def generate_uniform_cases(randomizer, case_count, extent_size, day_count):
+    """
+    Background noise: cases spread uniformly over the extent and the days
+    """
+    x = randomizer.uniform(0, extent_size, case_count)
+    y = randomizer.uniform(0, extent_size, case_count)
+    days = randomizer.integers(0, day_count, case_count)
+    return x, y, days
+
+
+def generate_hot_spot_cases(randomizer, case_count, extent_size, day_count, hot_spot_count=5, radius=500.0):
+    """
+    A uniform background (20% of the cases) with Gaussian hot spots, each active during a part of the days
+    """
+    background_count = case_count // 5
+    (x, y, days) = generate_uniform_cases(randomizer, background_count, extent_size, day_count)
+
+    hot_spot_x = randomizer.uniform(0, extent_size, hot_spot_count)
+    hot_spot_y = randomizer.uniform(0, extent_size, hot_spot_count)
+    hot_spot_start = randomizer.integers(0, day_count, hot_spot_count)
+
+    hot_spots = randomizer.integers(0, hot_spot_count, case_count - background_count)
+    hot_spot_days = hot_spot_start[hot_spots] + randomizer.integers(0, max(day_count // 3, 1), len(hot_spots))
+
+    x = numpy.concatenate((x, randomizer.normal(hot_spot_x[hot_spots], radius)))
+    y = numpy.concatenate((y, randomizer.normal(hot_spot_y[hot_spots], radius)))
+    days = numpy.concatenate((days, numpy.minimum(hot_spot_days, day_count - 1)))
+    return x, y, days
+
+
+def generate_moving_front_cases(randomizer, case_count, extent_size, day_count, front_width=1000.0):
+    """
+    An outbreak front that moves across the extent from west to east during the days
+    """
+    days = randomizer.integers(0, day_count, case_count)
+    front_x = extent_size * (days + 0.5) / day_count
+
+    x = front_x + randomizer.normal(0, front_width / 2, case_count)
+    y = randomizer.uniform(0, extent_size, case_count)
+    return x, y, days
+
+
+SCENARIOS = {
+    'uniform': generate_uniform_cases,
+    'hot_spots': generate_hot_spot_cases,
+    'moving_front': generate_moving_front_cases
+}
+
+
+def generate_cases(scenario, case_count, extent_size, startdate, day_count, seed=0, first_case_id=1):
+    """
+    Generates a seeded set of synthetic cases within the extent of get_extent(extent_size)
+
+    :param scenario: one of SCENARIOS
+    :return: CaseTable
+    """
+    randomizer = numpy.random.default_rng(seed)
+    (x, y, days) = SCENARIOS[scenario](randomizer, case_count, extent_size, day_count)
+
+    x = numpy.clip(x, 0, extent_size) + EXTENT_ORIGIN_X
+    y = numpy.clip(y, 0, extent_size) + EXTENT_ORIGIN_Y
+    report_days = startdate.toordinal() + numpy.asarray(days, dtype=numpy.int64)
+    ids = numpy.arange(first_case_id, first_case_id + len(x), dtype=numpy.int64)
+
+    return CaseTable(ids, report_days, x, y)
+
+
+def write_case_file(case_table, filepath):
+    """
+    Writes the cases as an import file with lat/long locations (EPSG:3857 x/y), see ImportService
+    """
+    with open(filepath, 'w') as case_file:
+        case_file.write("id\treport_date\tlong\tlat\n")
+        for index in range(len(case_table)):
+            case_file.write("{0}\t{1}\t{2!r}\t{3!r}\n".format(int(case_table.ids[index]),
+                                                              case_table.get_report_date(index).isoformat(),
+                                                              float(case_table.x[index]),
+                                                              float(case_table.y[index])))
+
+
+def generate_distribution_margins(seed=0, max_number_of_cases=100):
+    """
+    Generates a seeded, synthetic Monte Carlo table with rows of
+    (number_of_cases, close_in_space_and_time, close_time, close_space, cumulative_probability)
+    """
+    randomizer = numpy.random.default_rng(seed)
+    rows = []
+    for number_of_cases in range(2, max_number_of_cases + 1):
+        pair_count = number_of_cases * (number_of_cases - 1) // 2
+        for close_in_space_and_time in range(0, min(pair_count, 20) + 1):
+            for close_time in randomizer.choice(pair_count + 1, size=min(pair_count + 1, 5), replace=False):
+                close_space = int(randomizer.integers(close_in_space_and_time, pair_count + 1))
+                rows.append((number_of_cases,
+                             close_in_space_and_time,
+                             int(close_time),
+                             close_space,
+                             float(randomizer.uniform(0.0001, 1))))
+    return rows
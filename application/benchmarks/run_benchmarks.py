@@ -0,0 +1,328 @@
+"""
+Benchmarks of the stages of the risk pipeline, on seeded synthetic cases.
+
+Run from the application directory, e.g.:
+
+    python -m benchmarks.run_benchmarks --case-counts 1000 10000 --output benchmark.json
+    python -m benchmarks.run_benchmarks --database --compare benchmark.json
+
+Without --database only the in-memory stages are measured. With --database the
+import, SQL risk generation and export stages are measured against the database
+from dycast.config as well; the synthetic cases and risk are removed afterwards.
+Use a separate database for this: the synthetic cases use IDs from --first-case-id.
+"""
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import configargparse
+import numpy
+
+from benchmarks import case_generators
+from models.classes.case_table import CaseTable
+from models.classes.dycast_parameters import DycastParameters
+from models.classes.distribution_margin_table import DistributionMarginTable
+from models.enums import enums
+from models.models import Case, Risk
+from services import config_service
+from services import database_service
+from services import geography_service
+from services import logging_service
+from services import memory_cluster_service as memory_cluster_service_module
+from services import pair_count_service
+from services import risk_service as risk_service_module
+
+
+STARTDATE = datetime.date(2100, 1, 1)
+
+
+def create_parser():
+    config_file_path = config_service.get_default_config_file_path()
+    parser = configargparse.ArgParser(default_config_files=[config_file_path], ignore_unknown_config_file_keys=True)
+
+    parser.add('--scenarios',
+               nargs='+',
+               default=sorted(case_generators.SCENARIOS),
+               choices=sorted(case_generators.SCENARIOS),
+               help='Synthetic outbreak scenarios to benchmark')
+    parser.add('--case-counts',
+               nargs='+',
+               type=int,
+               default=[1000, 10000],
+               help='Number of synthetic cases per run')
+    parser.add('--extent-size',
+               type=float,
+               default=20000,
+               help='Default: 20000. Width and height of the square extent, in meters')
+    parser.add('--days',
+               type=int,
+               default=60,
+               help='Default: 60. Number of days the synthetic cases are spread over')
+    parser.add('--seed',
+               type=int,
+               default=0,
+               help='Default: 0. Seed of the synthetic case generators')
+    parser.add('--repeat',
+               type=int,
+               default=3,
+               help='Default: 3. Number of times every in-memory stage is timed')
+    parser.add('--grid-step', type=float, default=100)
+    parser.add('--spatial-domain', type=float, default=800)
+    parser.add('--temporal-domain', type=int, default=28)
+    parser.add('--close-in-space', type=float, default=200)
+    parser.add('--close-in-time', type=int, default=4)
+    parser.add('--case-threshold', type=int, default=10)
+    parser.add('--database',
+               action='store_true',
+               help='If this flag is provided: also benchmarks import, SQL risk generation and export')
+    parser.add('--first-case-id',
+               type=int,
+               default=900000000,
+               help='Default: 900000000. First ID of the synthetic cases that are imported with --database')
+    parser.add('--output',
+               default='benchmark_results.json',
+               help='Default: benchmark_results.json. File the results are written to, as JSON')
+    parser.add('--compare',
+               help='Optional: results file of an earlier run to compare with')
+
+    parser.add('--logfile', default='dycast_log.txt')
+    parser.add('--export-directory')
+    parser.add('--db-name', env_var='DBNAME')
+    parser.add('--db-user', env_var='DBUSER')
+    parser.add('--db-password')
+    parser.add('--db-host', env_var='DBHOST')
+    parser.add('--db-port', env_var='DBPORT')
+    parser.add('--system-srid', env_var='SYSTEM_SRID', default='3857')
+    return parser
+
+
+class BenchmarkRun(object):
+    """
+    Times the stages of one scenario and case count, and collects the results
+    """
+
+    def __init__(self, arguments, scenario, case_count):
+        self.arguments = arguments
+        self.scenario = scenario
+        self.case_count = case_count
+        self.results = []
+
+        self.dycast_parameters = get_dycast_parameters(arguments)
+        self.riskdate = STARTDATE + datetime.timedelta(days=arguments.days - 1)
+        self.case_table = case_generators.generate_cases(scenario,
+                                                         case_count,
+                                                         arguments.extent_size,
+                                                         STARTDATE,
+                                                         arguments.days,
+                                                         seed=arguments.seed,
+                                                         first_case_id=arguments.first_case_id)
+
+    def time_stage(self, stage, function, repeat=None, **counters):
+        repeat = repeat or self.arguments.repeat
+        durations = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            value = function()
+            durations.append(time.perf_counter() - start_time)
+
+        result = {
+            'scenario': self.scenario,
+            'case_count': self.case_count,
+            'stage': stage,
+            'seconds': min(durations),
+            'median_seconds': statistics.median(durations),
+            'repeat': repeat
+        }
+        result.update(counters)
+        self.results.append(result)
+
+        logging.info("%-12s %8s cases  %-28s %10.4f s", self.scenario, self.case_count, stage, min(durations))
+        return value
+
+    def run(self):
+        risk_service = risk_service_module.RiskService(self.dycast_parameters)
+
+        self.time_stage('generate_grid',
+                        lambda: geography_service.generate_grid(self.dycast_parameters))
+        (grid_x, grid_y) = geography_service.generate_grid_coordinates(self.dycast_parameters)
+
+        window_case_table = self.get_window_case_table()
+        memory_cluster_service = memory_cluster_service_module.MemoryClusterService(self.dycast_parameters,
+                                                                                    grid_x,
+                                                                                    grid_y)
+
+        def discover_clusters():
+            (point_indices, case_indices) = memory_cluster_service.get_point_case_pairs(window_case_table)
+            return memory_cluster_service.get_clusters_from_pairs(window_case_table, point_indices, case_indices)
+
+        clusters = self.time_stage('cluster_discovery', discover_clusters)
+        clusters = [cluster for cluster in clusters
+                    if cluster.get_case_count() >= self.dycast_parameters.case_threshold]
+        self.results[-1].update({'gridpoints': len(grid_x),
+                                 'cases_in_window': len(window_case_table),
+                                 'clusters_above_threshold': len(clusters)})
+
+        def count_close_pairs_per_cluster():
+            for cluster in clusters:
+                risk_service.get_close_space_and_time_for_cluster(cluster)
+
+        # The two measures that pair_count_service.use_close_pair_graph() decides on
+        total_case_count = sum(cluster.get_case_count() for cluster in clusters)
+        distinct_case_count = pair_count_service.get_distinct_case_count(clusters) if clusters else 0
+        self.time_stage('close_space_and_time', count_close_pairs_per_cluster,
+                        mean_cluster_size=total_case_count / len(clusters) if clusters else 0,
+                        cluster_overlap=total_case_count / distinct_case_count if distinct_case_count else 0)
+        self.time_stage('close_space_and_time_graph',
+                        lambda: risk_service.enrich_clusters_per_point_with_close_space_and_time_from_graph(clusters))
+        # Either of the above, as chosen by pair_count_service.use_close_pair_graph()
+        self.time_stage('close_space_and_time_selected',
+                        lambda: risk_service.enrich_clusters_per_point_with_close_space_and_time(clusters))
+
+        risk_service.distribution_margin_table = self.get_distribution_margin_table(risk_service)
+
+        def look_up_probabilities():
+            for cluster in clusters:
+                risk_service.get_cumulative_probability_for_cluster(None, cluster)
+
+        self.time_stage('probability_lookup', look_up_probabilities)
+
+        if self.arguments.database:
+            self.run_database_stages()
+
+        return self.results
+
+    def run_database_stages(self):
+        import_directory = tempfile.mkdtemp()
+        try:
+            case_file_path = os.path.join(import_directory, 'benchmark_cases.tsv')
+            case_generators.write_case_file(self.case_table, case_file_path)
+            self.dycast_parameters.files_to_import = [case_file_path]
+
+            for bulk_import in (False, True):
+                self.delete_benchmark_data()
+                self.dycast_parameters.bulk_import = bulk_import
+                self.time_stage('import_bulk' if bulk_import else 'import',
+                                self.dycast_parameters.import_cases,
+                                repeat=1)
+
+            # One day of the sql engine, without grid cache: from the case query up to the risk writes
+            self.dycast_parameters.engine = enums.Risk_engine.SQL
+            sql_risk_service = risk_service_module.RiskService(self.dycast_parameters)
+            self.time_stage('generate_risk_sql',
+                            lambda: sql_risk_service.generate_risk_for_dates(self.riskdate,
+                                                                             self.riskdate,
+                                                                             log_progress=False),
+                            repeat=1)
+
+            self.dycast_parameters.startdate = self.riskdate
+            self.dycast_parameters.enddate = self.riskdate
+            self.dycast_parameters.export_directory = import_directory
+            self.time_stage('export', self.dycast_parameters.export_risk, repeat=1)
+        finally:
+            self.delete_benchmark_data()
+            shutil.rmtree(import_directory)
+
+    def delete_benchmark_data(self):
+        with database_service.session_scope() as session:
+            session.query(Case).filter(Case.id >= self.arguments.first_case_id).delete(synchronize_session=False)
+            session.query(Risk).filter(Risk.risk_date >= STARTDATE).delete(synchronize_session=False)
+
+    def get_window_case_table(self):
+        window_startdate = self.riskdate - datetime.timedelta(days=self.dycast_parameters.temporal_domain)
+        in_window = (self.case_table.report_days >= window_startdate.toordinal()) & \
+                    (self.case_table.report_days <= self.riskdate.toordinal())
+        return CaseTable(self.case_table.ids[in_window],
+                         self.case_table.report_days[in_window],
+                         self.case_table.x[in_window],
+                         self.case_table.y[in_window])
+
+    def get_distribution_margin_table(self, risk_service):
+        if self.arguments.database:
+            with database_service.session_scope() as session:
+                return risk_service.get_distribution_margin_table(session)
+        return DistributionMarginTable.from_rows(case_generators.generate_distribution_margins(self.arguments.seed))
+
+
+def get_dycast_parameters(arguments):
+    dycast_parameters = DycastParameters()
+
+    (dycast_parameters.extent_min_x,
+     dycast_parameters.extent_min_y,
+     dycast_parameters.extent_max_x,
+     dycast_parameters.extent_max_y) = case_generators.get_extent(arguments.extent_size)
+    dycast_parameters.srid_of_extent = int(arguments.system_srid)
+    dycast_parameters.srid_of_cases = int(arguments.system_srid)
+    dycast_parameters.grid_step = arguments.grid_step
+
+    dycast_parameters.spatial_domain = arguments.spatial_domain
+    dycast_parameters.temporal_domain = arguments.temporal_domain
+    dycast_parameters.close_in_space = arguments.close_in_space
+    dycast_parameters.close_in_time = arguments.close_in_time
+    dycast_parameters.case_threshold = arguments.case_threshold
+    dycast_parameters.engine = enums.Risk_engine.MEMORY
+    dycast_parameters.export_format = 'tsv'
+
+    return dycast_parameters
+
+
+def get_environment():
+    return {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor()
+    }
+
+
+def compare_results(results, previous_results):
+    """
+    Logs the ratio between the (minimum) seconds of every stage and those of an earlier run
+    """
+    previous_seconds = {(result['scenario'], result['case_count'], result['stage']): result['seconds']
+                        for result in previous_results}
+
+    logging.info("Compared to earlier run (ratio > 1: slower):")
+    for result in results:
+        key = (result['scenario'], result['case_count'], result['stage'])
+        if key in previous_seconds and previous_seconds[key] > 0:
+            logging.info("%-12s %8s cases  %-28s %8.2fx",
+                         result['scenario'], result['case_count'], result['stage'],
+                         result['seconds'] / previous_seconds[key])
+
+
+def main(raw_args=None):
+    arguments = create_parser().parse_args(raw_args)
+
+    config_service.init_config(vars(arguments))
+    logging_service.init_logging()
+
+    results = []
+    for scenario in arguments.scenarios:
+        for case_count in arguments.case_counts:
+            results.extend(BenchmarkRun(arguments, scenario, case_count).run())
+
+    output = {
+        'environment': get_environment(),
+        'parameters': {key: value for key, value in vars(arguments).items()
+                       if key not in ('db_password', 'compare', 'output')},
+        'results': results
+    }
+    with open(arguments.output, 'w') as output_file:
+        json.dump(output, output_file, indent=2)
+    logging.info("Wrote benchmark results to: %s", arguments.output)
+
+    if arguments.compare:
+        with open(arguments.compare) as previous_file:
+            compare_results(results, json.load(previous_file)['results'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
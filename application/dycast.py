@@ -8,6 +8,7 @@ from util.custom_excepthook import custom_excepthook
 sys.excepthook = custom_excepthook
 
 from models.classes import dycast_parameters
+from models.enums import enums
 from services import config_service
 from services import conversion_service
 from services import database_service
@@ -92,6 +93,10 @@ def create_parser():
         subparser.add('--srid-cases',
                       env_var='SRID_CASES',
                       help='The SRID (projection) of the cases you are loading. Only required if your cases are in lat/long, not when they are in PostGIS geometry format')
+        subparser.add('--bulk-import',
+                      env_var='BULK_IMPORT',
+                      action='store_true',
+                      help='If this flag is provided: streams the case files into the database with COPY and inserts them with one statement per file, instead of case by case')
 
 
     ## Common arguments:
@@ -122,6 +127,32 @@ def create_parser():
                       env_var='SRID_EXTENT',
                       required=True,
                       help='The SRID (projection) of the specified extent.')
+        subparser.add('--grid-step',
+                      env_var='GRID_STEP',
+                      default='100',
+                      type=float,
+                      help='Default: 100. Distance in meters between the points of the grid for which risk is generated')
+        subparser.add('--workers',
+                      env_var='WORKERS',
+                      default='1',
+                      type=int,
+                      help='Default: 1. Number of worker processes the date range is split across, each with its own database connection')
+        subparser.add('--tile-size',
+                      env_var='TILE_SIZE',
+                      type=float,
+                      help='Optional: size in meters of the square tiles the grid is split into. The clusters of one tile are computed and written before the next tile starts, which limits memory use on large extents (sql engine only)')
+        subparser.add('--write-stages',
+                      env_var='WRITE_STAGES',
+                      action='store_true',
+                      help='If this flag is provided: appends the time spent and counters per stage of every day as JSON lines to a *_stages.jsonl file next to the log file')
+        subparser.add('--no-grid-pruning',
+                      env_var='NO_GRID_PRUNING',
+                      action='store_true',
+                      help='If this flag is provided: queries every gridpoint on every day, instead of only the gridpoints near enough cases to reach the case threshold (sql engine only)')
+        subparser.add('--grid-cache',
+                      env_var='GRID_CACHE',
+                      action='store_true',
+                      help='If this flag is provided: stores the generated grid in the grid cache directory, and reuses it in later runs with the same extent, SRIDs and grid step if it matches the grid in the database')
         subparser.add('--spatial-domain',
                       env_var='SPATIAL_DOMAIN',
                       default='800',
@@ -147,6 +178,21 @@ def create_parser():
                       default='10',
                       type=int,
                       help='Spatial domain used in Dycast risk generation and statistical analysis')
+        subparser.add('--engine',
+                      env_var='ENGINE',
+                      default='sql',
+                      choices=['sql', 'memory', 'incremental'],
+                      help='Default: sql. Engine used to find the cases near each gridpoint. "sql": cross join in PostGIS. "memory": load the cases of each day once and use an in-memory spatial index. "incremental": like "memory", but keeps the window of cases in memory across days, and updates the cases and close pair counts of every gridpoint with only the cases that enter or leave it')
+        subparser.add('--risk-batch-size',
+                      env_var='RISK_BATCH_SIZE',
+                      default='1000',
+                      type=int,
+                      help='Default: 1000. Number of risk rows that are buffered and written to the database in one statement')
+        subparser.add('--risk-flush-interval',
+                      env_var='RISK_FLUSH_INTERVAL',
+                      default='0',
+                      type=float,
+                      help='Default: 0 (disabled). Number of seconds after which buffered risk rows are written to the database, even if the batch is not full')
 
 
     ## Common arguments:
@@ -205,6 +251,9 @@ def add_common_arguments(main_parser):
     main_parser.add('--export-directory', '-e',
                     help="Optional: risk export directory. Default is defined in dycast.config.")
 
+    main_parser.add('--grid-cache-directory',
+                    help="Optional: grid cache directory, used with --grid-cache. Default is defined in dycast.config. A relative path is relative to the dycast directory")
+
     main_parser.add('--db-name',
                     env_var='DBNAME',
                     help='Override default database name from config file')
@@ -224,6 +273,26 @@ def add_common_arguments(main_parser):
                     env_var='DBPORT',
                     help='Override default database port from config file')
 
+    main_parser.add('--db-pool-size',
+                    env_var='DB_POOL_SIZE',
+                    type=int,
+                    help='Optional: number of database connections kept open per process. Default is defined in dycast.config')
+
+    main_parser.add('--db-max-overflow',
+                    env_var='DB_MAX_OVERFLOW',
+                    type=int,
+                    help='Optional: number of database connections that can be opened beyond --db-pool-size. Default is defined in dycast.config')
+
+    main_parser.add('--db-pool-recycle',
+                    env_var='DB_POOL_RECYCLE',
+                    type=int,
+                    help='Optional: seconds after which a pooled database connection is replaced. Default is defined in dycast.config')
+
+    main_parser.add('--no-db-pool-pre-ping',
+                    env_var='NO_DB_POOL_PRE_PING',
+                    action='store_true',
+                    help='If this flag is provided: pooled database connections are not tested before they are used')
+
     main_parser.add('--system-srid',
                     env_var='SYSTEM_SRID',
                     help='Override default system SRID from config file')
@@ -246,6 +315,7 @@ def import_cases(**kwargs):
     dycast.srid_of_cases = kwargs.get('srid_cases')
     dycast.dead_birds_dir = kwargs.get('import_directory', config_service.get_import_directory())
     dycast.files_to_import = kwargs.get('files')
+    dycast.bulk_import = kwargs.get('bulk_import', False)
 
     dycast.import_cases()
 
@@ -259,6 +329,9 @@ def generate_risk(**kwargs):
     dycast.close_in_space = float(kwargs.get('close_in_space'))
     dycast.close_in_time = int(kwargs.get('close_in_time'))
     dycast.case_threshold = int(kwargs.get('case_threshold'))
+    dycast.engine = enums.Risk_engine[kwargs.get('engine', 'sql').upper()]
+    dycast.risk_batch_size = int(kwargs.get('risk_batch_size', 1000))
+    dycast.risk_flush_interval = float(kwargs.get('risk_flush_interval', 0))
 
     dycast.startdate = kwargs.get('startdate', datetime.date.today())
     dycast.enddate = kwargs.get('enddate', dycast.startdate)
@@ -267,6 +340,13 @@ def generate_risk(**kwargs):
     dycast.extent_max_x = kwargs.get('extent_max_x')
     dycast.extent_max_y = kwargs.get('extent_max_y')
     dycast.srid_of_extent = kwargs.get('srid_extent')
+    dycast.grid_step = float(kwargs.get('grid_step', 100))
+    dycast.workers = int(kwargs.get('workers', 1))
+    dycast.tile_size = kwargs.get('tile_size')
+    dycast.write_stages = bool(kwargs.get('write_stages'))
+    dycast.grid_pruning = not kwargs.get('no_grid_pruning')
+    if kwargs.get('grid_cache'):
+        dycast.grid_cache_directory = config_service.get_grid_cache_directory()
 
     dycast.generate_risk()
 
@@ -0,0 +1,32 @@
+"""Add grid_points table for cached grids
+
+Revision ID: 8d1c5e2f7a90
+Revises: 49c435ef88a3
+Create Date: 2026-10-17 09:12:31.512204
+
+"""
+import geoalchemy2
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d1c5e2f7a90'
+down_revision = '49c435ef88a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('grid_points',
+                    sa.Column('grid_key', sa.String(length=40), nullable=False),
+                    sa.Column('point_index', sa.Integer(), nullable=False),
+                    sa.Column('location', geoalchemy2.types.Geometry(geometry_type='POINT', srid=3857), nullable=True),
+                    sa.PrimaryKeyConstraint('grid_key', 'point_index')
+                    )
+    # GeoAlchemy may already have created the spatial index along with the table
+    op.execute('CREATE INDEX IF NOT EXISTS idx_grid_points_location ON grid_points USING GIST (location)')
+
+
+def downgrade():
+    op.drop_table('grid_points')
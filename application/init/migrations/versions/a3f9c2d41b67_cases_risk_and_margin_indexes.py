@@ -0,0 +1,52 @@
+"""Add spatial and date indexes to cases, a date index to risk, and a lookup index to distribution_margins
+
+Revision ID: a3f9c2d41b67
+Revises: 8d1c5e2f7a90
+Create Date: 2026-10-17 14:03:52.118640
+
+Every index serves a query of the risk generation or the export, see the comments in upgrade().
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f9c2d41b67'
+down_revision = '8d1c5e2f7a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The cluster query of the sql engine joins every gridpoint with the cases in
+    # ST_DWithin(cases.location, point, spatial_domain), which can only use a GIST index.
+    # GeoAlchemy creates this index along with the cases table, but databases
+    # that were not created by the initial migration may not have it
+    op.execute('CREATE INDEX IF NOT EXISTS idx_cases_location ON cases USING GIST (location)')
+
+    # Every engine selects the cases of one temporal domain (report_date between the risk date
+    # minus temporal_domain and the risk date), a small part of all cases.
+    # Cases are not imported in date order, so a btree instead of BRIN
+    op.create_index('ix_cases_report_date', 'cases', ['report_date'], unique=False)
+
+    # The export selects risk by a risk_date range. Risk is written day after day,
+    # so the physical order follows risk_date and a BRIN index stays small
+    op.create_index('ix_risk_risk_date', 'risk', ['risk_date'], unique=False, postgresql_using='brin')
+
+    # The probability lookups of risk_service without the in-memory margin table: the
+    # exact match uses all four columns, the nearest close_time is looked up with equality
+    # on the first two columns, then the nearest close_space with equality on the first three
+    op.create_index('ix_distribution_margins_lookup',
+                    'distribution_margins',
+                    ['number_of_cases', 'close_in_space_and_time', 'close_time', 'close_space'],
+                    unique=False)
+
+    op.execute('ANALYZE cases')
+    op.execute('ANALYZE risk')
+    op.execute('ANALYZE distribution_margins')
+
+
+def downgrade():
+    op.drop_index('ix_distribution_margins_lookup', table_name='distribution_margins')
+    op.drop_index('ix_risk_risk_date', table_name='risk')
+    op.drop_index('ix_cases_report_date', table_name='cases')
+    # idx_cases_location is left in place: it is part of the initial migration
@@ -0,0 +1,141 @@
+"""Partition cases and risk by month on report_date and risk_date
+
+Revision ID: b7e2d5c18f34
+Revises: a3f9c2d41b67
+Create Date: 2026-10-17 16:27:09.604733
+
+Requires PostgreSQL 11 or later. The tables are recreated as partitioned tables with
+a partition for every month that has rows, and a default partition for rows of months
+without a partition. New partitions are created by services/partition_service.py.
+
+The primary key of a partitioned table has to contain the partition key, so the
+primary key of cases becomes (id, report_date). The IDs stay unique through the table
+case_ids, with primary key id: a trigger on cases adds, changes and removes its rows
+in the same transaction as the cases, so a second case with an existing ID fails.
+Cases without a report date cannot be partitioned; they are moved to the table
+cases_without_report_date, and keep their IDs in case_ids.
+"""
+import datetime
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d5c18f34'
+down_revision = 'a3f9c2d41b67'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    op.execute("CREATE TABLE case_ids (id integer PRIMARY KEY)")
+    op.execute("INSERT INTO case_ids SELECT id FROM cases")
+
+    if connection.execute("SELECT count(*) FROM cases WHERE report_date IS NULL").scalar():
+        op.execute("CREATE TABLE cases_without_report_date AS SELECT * FROM cases WHERE report_date IS NULL")
+        op.execute("DELETE FROM cases WHERE report_date IS NULL")
+
+    partition_table(connection, 'cases', 'report_date')
+    op.execute("ALTER TABLE cases ADD PRIMARY KEY (id, report_date)")
+    op.execute("CREATE INDEX idx_cases_location ON cases USING GIST (location)")
+    op.execute("CREATE INDEX ix_cases_report_date ON cases (report_date)")
+    create_case_ids_trigger()
+
+    partition_table(connection, 'risk', 'risk_date')
+    op.execute("ALTER TABLE risk ADD PRIMARY KEY (risk_date, lat, long)")
+    op.execute("CREATE INDEX ix_risk_risk_date ON risk USING BRIN (risk_date)")
+
+    op.execute("ANALYZE case_ids")
+    op.execute("ANALYZE cases")
+    op.execute("ANALYZE risk")
+
+
+def downgrade():
+    connection = op.get_bind()
+
+    unpartition_table('cases')
+    op.execute("DROP FUNCTION update_case_ids()")
+    op.execute("DROP TABLE case_ids")
+    op.execute("ALTER TABLE cases ALTER COLUMN report_date DROP NOT NULL")
+    if connection.execute("SELECT to_regclass('cases_without_report_date')").scalar():
+        op.execute("INSERT INTO cases SELECT * FROM cases_without_report_date")
+        op.execute("DROP TABLE cases_without_report_date")
+    # Keeps the first reported case of every ID, in case duplicate IDs got in
+    op.execute("""
+        DELETE FROM cases
+        WHERE ctid IN (SELECT ctid
+                       FROM (SELECT ctid,
+                                    row_number() OVER (PARTITION BY id ORDER BY report_date NULLS LAST) AS number
+                             FROM cases) AS numbered_cases
+                       WHERE number > 1)
+        """)
+    op.execute("ALTER TABLE cases ADD PRIMARY KEY (id)")
+    op.execute("CREATE INDEX idx_cases_location ON cases USING GIST (location)")
+    op.execute("CREATE INDEX ix_cases_report_date ON cases (report_date)")
+
+    unpartition_table('risk')
+    op.execute("ALTER TABLE risk ADD PRIMARY KEY (risk_date, lat, long)")
+    op.execute("CREATE INDEX ix_risk_risk_date ON risk USING BRIN (risk_date)")
+
+
+def create_case_ids_trigger():
+    """
+    Keeps case_ids equal to the IDs in cases. Moving rows out of the default partition,
+    see services/partition_service.py, deletes them from it without deleting the cases,
+    so those deletes are skipped.
+    """
+    op.execute("""
+        CREATE FUNCTION update_case_ids() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE')
+               AND coalesce(current_setting('dycast.moving_partition_rows', true), '') <> 'on' THEN
+                DELETE FROM case_ids WHERE id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO case_ids (id) VALUES (NEW.id);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """)
+    op.execute("CREATE TRIGGER cases_update_case_ids AFTER INSERT OR DELETE OR UPDATE OF id ON cases "
+               "FOR EACH ROW EXECUTE PROCEDURE update_case_ids()")
+
+
+def partition_table(connection, table_name, partition_key):
+    """
+    Replaces table_name by a table that is partitioned by month on partition_key, with the same
+    columns and rows. The primary key and the indexes are created afterwards, on the new table.
+    """
+    op.execute("CREATE TABLE {0}_partitioned (LIKE {0} INCLUDING DEFAULTS) PARTITION BY RANGE ({1})"
+               .format(table_name, partition_key))
+    op.execute("ALTER TABLE {0}_partitioned ALTER COLUMN {1} SET NOT NULL".format(table_name, partition_key))
+    op.execute("CREATE TABLE {0}_default PARTITION OF {0}_partitioned DEFAULT".format(table_name))
+
+    months = connection.execute("SELECT DISTINCT date_trunc('month', {1})::date FROM {0}"
+                                .format(table_name, partition_key))
+    for (month,) in months.fetchall():
+        # PostgreSQL 11 only accepts literals as partition bounds
+        next_month = get_next_month(month)
+        op.execute("CREATE TABLE {0}_y{1:04d}m{2:02d} PARTITION OF {0}_partitioned "
+                   "FOR VALUES FROM ('{3}') TO ('{4}')"
+                   .format(table_name, month.year, month.month, month.isoformat(), next_month.isoformat()))
+
+    op.execute("INSERT INTO {0}_partitioned SELECT * FROM {0}".format(table_name))
+    op.execute("DROP TABLE {0}".format(table_name))
+    op.execute("ALTER TABLE {0}_partitioned RENAME TO {0}".format(table_name))
+
+
+def unpartition_table(table_name):
+    op.execute("CREATE TABLE {0}_unpartitioned (LIKE {0} INCLUDING DEFAULTS)".format(table_name))
+    op.execute("INSERT INTO {0}_unpartitioned SELECT * FROM {0}".format(table_name))
+    op.execute("DROP TABLE {0}".format(table_name))
+    op.execute("ALTER TABLE {0}_unpartitioned RENAME TO {0}".format(table_name))
+
+
+def get_next_month(month):
+    if month.month == 12:
+        return datetime.date(month.year + 1, 1, 1)
+    return datetime.date(month.year, month.month + 1, 1)
@@ -0,0 +1,101 @@
+"""Key risk by (risk_date, cell_id) instead of (risk_date, lat, long)
+
+Revision ID: c4d8e1f9a2b3
+Revises: b7e2d5c18f34
+Create Date: 2026-10-17 19:41:27.325018
+
+Every location that risk is generated for gets an integer cell_id in the new table grid_cells,
+which is unique per (lat, long). Risk refers to the cell instead of storing its coordinates and
+geometry, so risk stays unique per (risk_date, location), as it was before: grids with different
+extents or grid keys share the cells of the locations they have in common.
+
+The cells are the locations of the existing risk and of the grids in grid_points. The gridpoints
+in grid_points are kept, and get their column and row in their grid.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e1f9a2b3'
+down_revision = 'b7e2d5c18f34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Grids are regular in EPSG:3857: columns go west to east, rows north to south
+    op.execute("ALTER TABLE grid_points ADD COLUMN column_index integer, ADD COLUMN row_index integer")
+    op.execute("""
+        UPDATE grid_points
+        SET column_index = positions.column_index,
+            row_index = positions.row_index
+        FROM (SELECT grid_key,
+                     point_index,
+                     dense_rank() OVER (PARTITION BY grid_key ORDER BY ST_X(location)) - 1 AS column_index,
+                     dense_rank() OVER (PARTITION BY grid_key ORDER BY ST_Y(location) DESC) - 1 AS row_index
+              FROM grid_points) AS positions
+        WHERE grid_points.grid_key = positions.grid_key
+          AND grid_points.point_index = positions.point_index
+        """)
+    op.execute("ALTER TABLE grid_points ALTER COLUMN column_index SET NOT NULL, ALTER COLUMN row_index SET NOT NULL")
+
+    op.execute("""
+        CREATE TABLE grid_cells (
+            cell_id serial PRIMARY KEY,
+            lat double precision NOT NULL,
+            long double precision NOT NULL,
+            CONSTRAINT grid_cells_lat_long_key UNIQUE (lat, long)
+        )
+        """)
+    op.execute("""
+        INSERT INTO grid_cells (lat, long)
+        SELECT lat, long FROM risk
+        UNION
+        SELECT ST_Y(location), ST_X(location) FROM grid_points
+        ORDER BY long, lat DESC
+        """)
+
+    op.execute("ALTER TABLE risk ADD COLUMN cell_id integer")
+    op.execute("""
+        UPDATE risk
+        SET cell_id = grid_cells.cell_id
+        FROM grid_cells
+        WHERE grid_cells.lat = risk.lat
+          AND grid_cells.long = risk.long
+        """)
+
+    op.execute("ALTER TABLE risk DROP CONSTRAINT risk_pkey")
+    op.execute("ALTER TABLE risk DROP COLUMN lat, DROP COLUMN long, DROP COLUMN location")
+    op.execute("ALTER TABLE risk ALTER COLUMN cell_id SET NOT NULL")
+    op.execute("ALTER TABLE risk ADD PRIMARY KEY (risk_date, cell_id)")
+    op.execute("ALTER TABLE risk ADD CONSTRAINT risk_cell_id_fkey FOREIGN KEY (cell_id) REFERENCES grid_cells (cell_id)")
+    # Time series of one cell; the primary key serves the lookups by date
+    op.execute("CREATE INDEX ix_risk_cell_id_risk_date ON risk (cell_id, risk_date)")
+
+    op.execute("ANALYZE grid_points")
+    op.execute("ANALYZE grid_cells")
+    op.execute("ANALYZE risk")
+
+
+def downgrade():
+    op.execute("ALTER TABLE risk ADD COLUMN lat double precision, "
+               "ADD COLUMN long double precision, "
+               "ADD COLUMN location geometry(Point, 3857)")
+    op.execute("""
+        UPDATE risk
+        SET lat = grid_cells.lat,
+            long = grid_cells.long,
+            location = ST_SetSRID(ST_MakePoint(grid_cells.long, grid_cells.lat), 3857)
+        FROM grid_cells
+        WHERE grid_cells.cell_id = risk.cell_id
+        """)
+
+    op.execute("DROP INDEX ix_risk_cell_id_risk_date")
+    op.execute("ALTER TABLE risk DROP CONSTRAINT risk_cell_id_fkey")
+    op.execute("ALTER TABLE risk DROP CONSTRAINT risk_pkey")
+    op.execute("ALTER TABLE risk DROP COLUMN cell_id")
+    op.execute("ALTER TABLE risk ALTER COLUMN lat SET NOT NULL, ALTER COLUMN long SET NOT NULL")
+    op.execute("ALTER TABLE risk ADD PRIMARY KEY (risk_date, lat, long)")
+
+    op.execute("DROP TABLE grid_cells")
+    op.execute("ALTER TABLE grid_points DROP COLUMN column_index, DROP COLUMN row_index")
@@ -0,0 +1,64 @@
+import datetime
+
+import numpy
+import shapely.geometry
+
+from models.models import Case
+
+
+class CaseTable(object):
+    """
+    Columnar, in-memory representation of a set of cases.
+    Report dates are stored as day ordinals (see datetime.date.toordinal()).
+    """
+
+    def __init__(self, ids=None, report_days=None, x=None, y=None):
+        self.ids = numpy.asarray(ids if ids is not None else [], dtype=numpy.int64)
+        self.report_days = numpy.asarray(report_days if report_days is not None else [], dtype=numpy.int64)
+        self.x = numpy.asarray(x if x is not None else [], dtype=numpy.float64)
+        self.y = numpy.asarray(y if y is not None else [], dtype=numpy.float64)
+
+        self._id_order = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        :param rows: iterable of (id, report_date, x, y)
+        """
+        ids = []
+        report_days = []
+        x = []
+        y = []
+        for (case_id, report_date, case_x, case_y) in rows:
+            ids.append(case_id)
+            report_days.append(report_date.toordinal())
+            x.append(case_x)
+            y.append(case_y)
+        return cls(ids, report_days, x, y)
+
+    def get_report_date(self, index):
+        return datetime.date.fromordinal(int(self.report_days[index]))
+
+    def get_indices(self, case_ids):
+        """
+        Returns the indices of the cases with these IDs, which must all be in this table
+        """
+        if self._id_order is None:
+            self._id_order = numpy.argsort(self.ids, kind='mergesort')
+        positions = numpy.searchsorted(self.ids, case_ids, sorter=self._id_order)
+        return self._id_order[positions]
+
+    def get_case(self, index):
+        """
+        Returns the case at this index as a (detached) Case, with a shapely Point as location
+        """
+        case = Case()
+
+        case.id = int(self.ids[index])
+        case.report_date = self.get_report_date(index)
+        case.location = shapely.geometry.Point(self.x[index], self.y[index])
+
+        return case
@@ -1,16 +1,72 @@
 
 
+import numpy
+
+
 class Cluster(object):
+    """
+    The cases within the spatial domain of one gridpoint.
+
+    Cases are either stored as a list of Case objects (`cases`), or as an array of
+    indices (`case_indices`) into a CaseTable that is shared by all clusters of a day
+    (`case_table`), so that a case in many clusters is only stored once.
+    In the latter case `cases` creates the Case objects on every access, so the
+    services read the cases with get_case_columns() instead.
+    """
+
+    __slots__ = ('point',
+                 'point_index',
+                 'case_table',
+                 'case_indices',
+                 '_cases',
+                 'case_count',
+                 'close_in_space',
+                 'close_in_time',
+                 'close_space_and_time',
+                 'cumulative_probability')
 
     def __init__(self):
         self.point = None
-        self.cases = None
+        self.point_index = None
+        self.case_table = None
+        self.case_indices = None
+        self._cases = None
         self.case_count = None
         self.close_in_space = None
         self.close_in_time = None
         self.close_space_and_time = None
         self.cumulative_probability = None
 
+    @property
+    def cases(self):
+        if self._cases is None and self.case_indices is not None:
+            return [self.case_table.get_case(case_index) for case_index in self.case_indices]
+        return self._cases
+
+    @cases.setter
+    def cases(self, cases):
+        self._cases = cases
+
     def get_case_count(self):
-        if self.cases is not None:
-            return len(self.cases)
+        if self.case_indices is not None:
+            return len(self.case_indices)
+        if self._cases is not None:
+            return len(self._cases)
+
+    def get_case_columns(self):
+        """
+        Returns the ids, x and y coordinates and report dates (as day ordinals) of the cases
+        as four arrays, without creating Case objects for the cases in a CaseTable
+        """
+        if self.case_indices is not None:
+            case_table = self.case_table
+            return (case_table.ids[self.case_indices],
+                    case_table.x[self.case_indices],
+                    case_table.y[self.case_indices],
+                    case_table.report_days[self.case_indices])
+
+        cases = self._cases or []
+        return (numpy.array([case.id for case in cases], dtype=numpy.int64),
+                numpy.array([case.location.x for case in cases], dtype=numpy.float64),
+                numpy.array([case.location.y for case in cases], dtype=numpy.float64),
+                numpy.array([case.report_date.toordinal() for case in cases], dtype=numpy.int64))
@@ -0,0 +1,118 @@
+import sys
+
+import numpy
+
+
+class DistributionMarginTable(object):
+    """
+    In-memory copy of the distribution_margins (Monte Carlo) table, for looking up the
+    cumulative probability of a cluster without querying the database.
+
+    Rows are sorted by (number_of_cases, close_in_space_and_time, close_time, close_space),
+    and every (number_of_cases, close_in_space_and_time) combination maps to a slice of
+    the sorted arrays, so that exact and nearest close_time/close_space lookups are
+    binary searches.
+    """
+
+    def __init__(self, number_of_cases, close_in_space_and_time, close_time, close_space, cumulative_probability):
+        number_of_cases = numpy.asarray(number_of_cases, dtype=numpy.int64)
+        close_in_space_and_time = numpy.asarray(close_in_space_and_time, dtype=numpy.int64)
+        close_time = numpy.asarray(close_time, dtype=numpy.int64)
+        close_space = numpy.asarray(close_space, dtype=numpy.int64)
+        cumulative_probability = numpy.asarray(cumulative_probability, dtype=numpy.float64)
+
+        order = numpy.lexsort((close_space, close_time, close_in_space_and_time, number_of_cases))
+        self.close_time = close_time[order]
+        self.close_space = close_space[order]
+        self.cumulative_probability = cumulative_probability[order]
+
+        number_of_cases = number_of_cases[order]
+        close_in_space_and_time = close_in_space_and_time[order]
+
+        self.slices = {}
+        if len(order):
+            is_group_start = numpy.concatenate(([True],
+                                                (numpy.diff(number_of_cases) != 0) |
+                                                (numpy.diff(close_in_space_and_time) != 0)))
+            starts = numpy.flatnonzero(is_group_start)
+            ends = numpy.concatenate((starts[1:], [len(order)]))
+            for start, end in zip(starts, ends):
+                key = (int(number_of_cases[start]), int(close_in_space_and_time[start]))
+                self.slices[key] = (int(start), int(end))
+
+    def __len__(self):
+        return len(self.close_time)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        :param rows: iterable of (number_of_cases, close_in_space_and_time, close_time, close_space, cumulative_probability)
+        """
+        columns = ([], [], [], [], [])
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+
+        # A missing probability behaves like a missing match, see get_cumulative_probability()
+        cumulative_probability = [numpy.nan if value is None else value for value in columns[4]]
+        return cls(columns[0], columns[1], columns[2], columns[3], cumulative_probability)
+
+    def get_cumulative_probability(self, number_of_cases, close_in_space_and_time, close_in_space, close_in_time):
+        """
+        Same lookup as RiskService.get_cumulative_probability_for_cluster() does in the database:
+        first an exact match; if there is none (or its probability is 0 or empty), the row with
+        the nearest close_time and then the nearest close_space, defaulting to 0.001 if that row
+        has no probability and to 0.0001 if there are no rows for this number of cases and close pairs.
+        Ties in distance, which the database resolves arbitrarily, resolve to the lowest value here.
+        """
+        group = self.slices.get((number_of_cases, close_in_space_and_time))
+        if group is None:
+            return 0.0001
+        (start, end) = group
+
+        close_time = self.close_time[start:end]
+        time_start, time_end = get_value_range(close_time, close_in_time)
+        if time_end > time_start:
+            close_space = self.close_space[start + time_start:start + time_end]
+            space_start, space_end = get_value_range(close_space, close_in_space)
+            if space_end > space_start:
+                exact_match = self.cumulative_probability[start + time_start + space_start]
+                if exact_match and not numpy.isnan(exact_match):
+                    return float(exact_match)
+
+        nearest_close_time = close_time[get_nearest_position(close_time, close_in_time)]
+        time_start, time_end = get_value_range(close_time, nearest_close_time)
+
+        close_space = self.close_space[start + time_start:start + time_end]
+        nearest_position = start + time_start + get_nearest_position(close_space, close_in_space)
+
+        cumulative_probability = self.cumulative_probability[nearest_position]
+        if not cumulative_probability or numpy.isnan(cumulative_probability):
+            return 0.001
+        return float(cumulative_probability)
+
+    def get_memory_footprint(self):
+        """
+        Returns the approximate memory used by this table, in bytes
+        """
+        array_bytes = self.close_time.nbytes + self.close_space.nbytes + self.cumulative_probability.nbytes
+        slice_bytes = sys.getsizeof(self.slices)
+        for key, value in self.slices.items():
+            slice_bytes += sys.getsizeof(key) + sys.getsizeof(value)
+            slice_bytes += sum(sys.getsizeof(item) for item in key + value)
+        return array_bytes + slice_bytes
+
+
+def get_value_range(sorted_values, value):
+    start = numpy.searchsorted(sorted_values, value, side='left')
+    end = numpy.searchsorted(sorted_values, value, side='right')
+    return int(start), int(end)
+
+
+def get_nearest_position(sorted_values, value):
+    position = int(numpy.searchsorted(sorted_values, value, side='left'))
+    if position == len(sorted_values):
+        return position - 1
+    if position > 0 and value - sorted_values[position - 1] <= sorted_values[position] - value:
+        return position - 1
+    return position
@@ -5,6 +5,7 @@
 
 import logging
 
+from models.enums import enums
 from services import import_service as import_service_module
 from services import export_service as export_service_module
 from services import risk_service as risk_service_module
@@ -16,6 +17,7 @@ class DycastParameters(object):
         self.srid_of_cases = None
         self.dead_birds_dir = None
         self.files_to_import = None
+        self.bulk_import = False
 
         self.export_directory = None
         self.export_prefix = None
@@ -26,6 +28,9 @@ class DycastParameters(object):
         self.close_in_space = None
         self.close_in_time = None
         self.case_threshold = None
+        self.engine = enums.Risk_engine.SQL
+        self.risk_batch_size = 1000
+        self.risk_flush_interval = 0
 
         self.startdate = None
         self.enddate = None
@@ -35,6 +40,12 @@ class DycastParameters(object):
         self.extent_max_x = None
         self.extent_max_y = None
         self.srid_of_extent = None
+        self.grid_step = 100
+        self.grid_cache_directory = None
+        self.grid_pruning = True
+        self.workers = 1
+        self.tile_size = None
+        self.write_stages = False
 
         for (key, value) in kwargs.items():
             if hasattr(self, key):
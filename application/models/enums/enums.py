@@ -3,3 +3,8 @@ from enum import Enum
 class Location_type(Enum):
     GEOMETRY = 1
     LAT_LONG = 2
+
+class Risk_engine(Enum):
+    SQL = 1
+    MEMORY = 2
+    INCREMENTAL = 3
@@ -1,6 +1,6 @@
 import logging
 
-from sqlalchemy import Column, Integer, Float, Date
+from sqlalchemy import Column, ForeignKey, Index, Integer, Float, Date, String, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from geoalchemy2 import Geometry
 
@@ -23,10 +23,20 @@ class Case(DeclarativeBase):
     """SQLAlchemy Case model"""
     __tablename__ = "cases"
 
+    # Partitioned by month on report_date, see services/partition_service.py;
+    # in the database the primary key is (id, report_date)
     id = Column(Integer, primary_key=True)
-    report_date = Column(Date)
+    report_date = Column(Date, index=True, nullable=False)
     location = Column(Geometry(geometry_type='POINT', srid='3857'))
 
+class CaseId(DeclarativeBase):
+    """SQLAlchemy Case ID model, the IDs of all cases"""
+    __tablename__ = "case_ids"
+
+    # Kept by a trigger on cases (see migration b7e2d5c18f34), so that case IDs stay unique
+    # although the primary key of the partitioned cases table is (id, report_date)
+    id = Column(Integer, primary_key=True)
+
 class DistributionMargin(DeclarativeBase):
     """SQLAlchemy Distribution Margins model (Monte Carlo)"""
     __tablename__ = "distribution_margins"
@@ -38,16 +48,48 @@ class DistributionMargin(DeclarativeBase):
     close_space = Column(Integer, primary_key=True, index=True)
     close_time = Column(Integer, primary_key=True, index=True)
 
+    __table_args__ = (
+        Index('ix_distribution_margins_lookup', 'number_of_cases', 'close_in_space_and_time', 'close_time', 'close_space'),
+    )
+
 class Risk(DeclarativeBase):
     """SQLAlchemy Risk model"""
     __tablename__ = "risk"
 
+    # Partitioned by month on risk_date, see services/partition_service.py
     risk_date = Column(Date, primary_key=True)
-    lat = Column(Float, primary_key=True)
-    long = Column(Float, primary_key=True)
-    location = Column(Geometry(geometry_type='POINT', srid='3857'))
+    cell_id = Column(Integer, ForeignKey('grid_cells.cell_id'), primary_key=True)
     number_of_cases = Column(Integer)
     close_pairs = Column(Integer)
     close_space = Column(Integer)
     close_time = Column(Integer)
     cumulative_probability = Column(Float)
+
+    __table_args__ = (
+        Index('ix_risk_risk_date', 'risk_date', postgresql_using='brin'),
+        Index('ix_risk_cell_id_risk_date', 'cell_id', 'risk_date'),
+    )
+
+class GridPoint(DeclarativeBase):
+    """SQLAlchemy Grid Point model, the gridpoints of every grid that was used (see grid_service)"""
+    __tablename__ = "grid_points"
+
+    grid_key = Column(String(40), primary_key=True)
+    point_index = Column(Integer, primary_key=True)
+    column_index = Column(Integer, nullable=False)
+    row_index = Column(Integer, nullable=False)
+    location = Column(Geometry(geometry_type='POINT', srid='3857'))
+
+class GridCell(DeclarativeBase):
+    """SQLAlchemy Grid Cell model, a location that risk is generated for (see grid_service)"""
+    __tablename__ = "grid_cells"
+
+    # One cell per location, whichever grids it is part of, so that the risk
+    # of a location is one time series, as before with (risk_date, lat, long)
+    cell_id = Column(Integer, primary_key=True)
+    lat = Column(Float, nullable=False)
+    long = Column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('lat', 'long', name='grid_cells_lat_long_key'),
+    )
@@ -48,6 +48,12 @@ def get_export_directory():
     return os.path.join(root_directory, export_directory)
 
 
+def get_grid_cache_directory():
+    grid_cache_directory = CONFIG.get("grid_cache_directory")
+    root_directory = get_root_directory()
+    return os.path.join(root_directory, grid_cache_directory)
+
+
 def get_default_config_file_path():
     config_file_name = 'dycast.config'
     application_directory = get_application_directory()
@@ -1,12 +1,12 @@
 import os
 import time
 import logging
+from contextlib import contextmanager
 
-import psycopg2
 from alembic import command
 from alembic.config import Config
 from alembic.util.exc import CommandError
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine, event, exc, func
 from sqlalchemy.engine.url import URL
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -17,6 +17,13 @@ from services import config_service
 CONFIG = config_service.get_config()
 DeclarativeBase = declarative_base()
 
+# Shared engines, one per process and connection string, see get_engine()
+ENGINES = {}
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_RECYCLE = 3600
+
 
 # Helper functions common
 
@@ -35,17 +42,83 @@ def get_db_host():
 def get_db_port():
     return CONFIG.get("db_port")
 
+def get_db_pool_size():
+    return int(CONFIG.get("db_pool_size") or DEFAULT_POOL_SIZE)
+
+def get_db_max_overflow():
+    return int(CONFIG.get("db_max_overflow") or DEFAULT_MAX_OVERFLOW)
+
+def get_db_pool_recycle():
+    return int(CONFIG.get("db_pool_recycle") or DEFAULT_POOL_RECYCLE)
+
+def get_db_pool_pre_ping():
+    return not CONFIG.get("no_db_pool_pre_ping")
+
 
 # Helper functions SQLAlchemy
 
 def db_connect():
     """
     Connect to database.
-    Returns sqlalchemy engine instance
+    Returns a new sqlalchemy engine instance, that is not shared: dispose it when done.
+    Use get_engine() for the shared engine.
     """
     return create_engine(get_sqlalchemy_conn_string())
 
 
+def get_engine():
+    """
+    Returns the engine of this process, with a connection pool that is shared by all
+    sessions and raw connections. The engine is created on first use.
+
+    Worker processes (multiprocessing) get an engine of their own: pooled connections
+    are never used in another process than the one that opened them, see guard_pool_against_fork()
+    """
+    conn_string = get_sqlalchemy_conn_string()
+    key = (os.getpid(), str(conn_string))
+
+    engine = ENGINES.get(key)
+    if engine is None:
+        engine = create_engine(conn_string,
+                               pool_size=get_db_pool_size(),
+                               max_overflow=get_db_max_overflow(),
+                               pool_recycle=get_db_pool_recycle(),
+                               pool_pre_ping=get_db_pool_pre_ping())
+        guard_pool_against_fork(engine)
+        ENGINES[key] = engine
+    return engine
+
+
+def guard_pool_against_fork(engine):
+    """
+    A forked process inherits the pooled connections of its parent. Connections
+    that were opened by another process are discarded on checkout (without closing
+    them, the parent still uses them) and replaced by a new connection.
+    """
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info['pid'] != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                "Connection record belongs to pid {0}, attempting to check out in pid {1}".format(
+                    connection_record.info['pid'], pid))
+
+
+def dispose_engines():
+    """
+    Closes the pooled connections of the engines of this process.
+    Call before starting worker processes, so that they do not inherit open connections.
+    """
+    pid = os.getpid()
+    for key in [key for key in ENGINES if key[0] == pid]:
+        ENGINES.pop(key).dispose()
+
+
 def execute_sql_command(sql_command, engine):
     engine.execute(sql_command)
 
@@ -60,18 +133,36 @@ def get_sqlalchemy_conn_string():
 
 
 def get_sqlalchemy_session():
-    engine = db_connect()
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     return Session()
 
 
+@contextmanager
+def session_scope():
+    """
+    Session for a unit of work: commits when the block is done,
+    rolls back if it raises, and always closes the session
+    """
+    session = get_sqlalchemy_session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
 
 # Helper functions Psycopg2
 
 def init_psycopg_db():
-    dsn = get_dsn()
+    """
+    Returns a cursor and a psycopg2 connection from the pool of the shared engine.
+    Closing the connection returns it to the pool.
+    """
     try:
-        conn = psycopg2.connect(dsn)
+        conn = get_engine().raw_connection()
     except Exception:
         logging.exception("Unable to connect to database")
         raise
@@ -151,6 +242,7 @@ def init_db(monte_carlo_file, force=False):
             if database_exists(db_url):
                 logging.info("Dropping existing database in 5 seconds...")
                 time.sleep(5)
+                dispose_engines()
                 drop_database(db_url)
                 logging.info("Dropped.")
 
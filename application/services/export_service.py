@@ -1,3 +1,4 @@
+import itertools
 import sys
 import os
 import logging
@@ -6,17 +7,17 @@ from services import conversion_service
 from services import config_service
 from services import database_service
 from services import file_service
-from models.models import Risk
+from models.models import GridCell, Risk
 
 
 CONFIG = config_service.get_config()
 
+# Number of risk rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 10000
+
 class ExportService(object):
     
     def export_risk(self, dycast_parameters):
-
-        session = database_service.get_sqlalchemy_session()
-
         startdate = dycast_parameters.startdate
         enddate = dycast_parameters.enddate
         export_directory = dycast_parameters.export_directory
@@ -45,32 +46,52 @@ class ExportService(object):
 
 
         logging.info("Exporting risk for: %s - %s", startdate_string, enddate_string)
-        risk_query = self.get_risk_query(session, startdate, enddate)
-        risk_count = database_service.get_count_for_query(risk_query)
+        with database_service.session_scope() as session:
+            risk_query = self.get_risk_query(session, startdate, enddate)
 
-        if risk_count == 0:
-            logging.info("No risk found for the provided dates: %s - %s", startdate_string, enddate_string)
-            return
+            # Stream rows from a server-side cursor, instead of loading all of them at once
+            risk_rows = iter(risk_query.with_entities(Risk.risk_date,
+                                                      GridCell.lat,
+                                                      GridCell.long,
+                                                      Risk.number_of_cases,
+                                                      Risk.close_pairs,
+                                                      Risk.close_time,
+                                                      Risk.close_space,
+                                                      Risk.cumulative_probability)
+                             .yield_per(EXPORT_BATCH_SIZE))
 
-        risk_collection = risk_query.all()
+            first_risk = next(risk_rows, None)
+            if first_risk is None:
+                logging.info("No risk found for the provided dates: %s - %s", startdate_string, enddate_string)
+                return
 
-        table_content = file_service.TableContent()
+            header = self.get_header_as_string(separator)
+            lines = self.get_lines(header, itertools.chain([first_risk], risk_rows), separator)
 
-        header = self.get_header_as_string(separator)
-        table_content.set_header(header)
+            line_count = file_service.save_lines(lines, filepath)
 
-        body = self.get_rows_as_string(risk_collection, separator)
-        table_content.set_body(body)
+        logging.info("Exported %s risk rows to: %s", line_count - 2, filepath)
 
+        return filepath
 
-        file_service.save_file(table_content.get_content(), filepath)
 
-        return filepath
+    def get_lines(self, header, risk_collection, separator):
+        """
+        Yields the lines of the export file: same content as a TableContent of
+        get_header_as_string() and get_rows_as_string(), one line at a time
+        """
+        yield header + "\n"
+        for risk in risk_collection:
+            yield self.get_row_as_string(risk, separator)
+        yield "\n"
 
 
     def get_risk_query(self, session, startdate, enddate):
-        return session.query(Risk).filter(Risk.risk_date >= startdate,
-                                          Risk.risk_date <= enddate)
+        # The location of the risk is that of its grid cell
+        return session.query(Risk) \
+            .join(GridCell, GridCell.cell_id == Risk.cell_id) \
+            .filter(Risk.risk_date >= startdate,
+                    Risk.risk_date <= enddate)
       
 
     def get_header_as_string(self, separator):
@@ -78,18 +99,18 @@ class ExportService(object):
 
 
     def get_rows_as_string(self, risk_collection, separator):
-        string = ""
-        for risk in risk_collection:
-            string = string + "{0}{8}{1}{8}{2}{8}{3}{8}{4}{8}{5}{8}{6}{8}{7}\n".format(risk.risk_date,
-                                                                                       risk.lat,
-                                                                                       risk.long,
-                                                                                       risk.number_of_cases,
-                                                                                       risk.close_pairs,
-                                                                                       risk.close_time,
-                                                                                       risk.close_space,
-                                                                                       risk.cumulative_probability,
-                                                                                       separator)
-        return string
+        return "".join(self.get_row_as_string(risk, separator) for risk in risk_collection)
+
+    def get_row_as_string(self, risk, separator):
+        return "{0}{8}{1}{8}{2}{8}{3}{8}{4}{8}{5}{8}{6}{8}{7}\n".format(risk.risk_date,
+                                                                     risk.lat,
+                                                                     risk.long,
+                                                                     risk.number_of_cases,
+                                                                     risk.close_pairs,
+                                                                     risk.close_time,
+                                                                     risk.close_space,
+                                                                     risk.cumulative_probability,
+                                                                     separator)
 
     def get_separator(self, file_format):
         if file_format == "tsv":
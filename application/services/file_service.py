@@ -1,13 +1,18 @@
 import urllib.request, urllib.parse, urllib.error
 import fileinput
+import io
 import logging
 import boto3
 import botocore
 import rfc3986
 from rfc3986.exceptions import MissingComponentError, UnpermittedComponentError, InvalidComponentsError
 import os
+import uuid
 
 
+# Size of the parts of a streamed (multipart) upload to S3. S3 requires at least 5 MB per part
+S3_PART_SIZE = 8 * 1024 * 1024
+
 VALIDATOR = rfc3986.validators.Validator().allow_schemes(
         'http',
         'https',
@@ -72,6 +77,105 @@ def save_file(body, filepath):
             "File location '{0}' not supported".format(file_uri.scheme))
 
 
+def save_lines(lines, filepath):
+    """
+    Streams an iterable of strings to a file, without holding the whole content in memory.
+    Local files are written to a temporary file next to filepath, which replaces filepath once all
+    strings are written, and S3 uploads are aborted on errors: a failed export leaves no partial file.
+    Returns the number of strings written.
+    """
+    if not filepath:
+        raise IOError("File path cannot be empty")
+
+    file_uri = get_file_uri(filepath)
+
+    if file_uri.scheme == "s3":
+        with S3FileWriter(file_uri) as output_file:
+            return write_lines(lines, output_file)
+    elif (file_uri.scheme == "file") or (file_uri.scheme is None):
+        return save_lines_local(lines, filepath)
+    else:
+        raise ValueError(
+            "File location '{0}' not supported".format(file_uri.scheme))
+
+
+class S3FileWriter(object):
+    """
+    File-like writer that streams its content to AWS S3 as a multipart upload,
+    so that only one part is held in memory at a time.
+    The multipart upload is aborted if writing or completing it fails.
+    """
+
+    def __init__(self, s3_uri, s3_client=None, part_size=S3_PART_SIZE):
+        logging.debug("Saving file to AWS S3...")
+        self.bucket = s3_uri.host
+        self.key = get_path_from_s3_uri(s3_uri)
+        self.part_size = part_size
+
+        if s3_client is None:
+            boto3_session = boto3.Session()
+            s3_client = boto3_session.client("s3")
+        self.s3_client = s3_client
+
+        self._buffer = io.BytesIO()
+        self._upload_id = None
+        self._parts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, text):
+        self._buffer.write(text.encode("utf-8"))
+        if self._buffer.tell() >= self.part_size:
+            self._upload_part()
+
+    def close(self):
+        try:
+            if self._upload_id is None:
+                # Small enough for a single upload
+                response = self.s3_client.put_object(Body=self._buffer.getvalue(), Bucket=self.bucket, Key=self.key)
+            else:
+                if self._buffer.tell():
+                    self._upload_part()
+                response = self.s3_client.complete_multipart_upload(Bucket=self.bucket,
+                                                                    Key=self.key,
+                                                                    UploadId=self._upload_id,
+                                                                    MultipartUpload={'Parts': self._parts})
+            logging.info("Done saving to AWS S3. Response:")
+            logging.info(response)
+        except Exception:
+            logging.error(
+                "There was a problem uploading file '%s' to bucket '%s'", self.key, self.bucket)
+            self.abort()
+            raise
+
+    def abort(self):
+        if self._upload_id is not None:
+            upload_id = self._upload_id
+            self._upload_id = None
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=upload_id)
+
+    def _upload_part(self):
+        if self._upload_id is None:
+            response = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self._upload_id = response['UploadId']
+
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(Body=self._buffer.getvalue(),
+                                              Bucket=self.bucket,
+                                              Key=self.key,
+                                              PartNumber=part_number,
+                                              UploadId=self._upload_id)
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self._buffer = io.BytesIO()
+
+
 # 'Private' methods
 
 # Read
@@ -153,6 +257,31 @@ def save_file_local(body, filepath):
     write_local_file(body, filepath)
 
 
+def save_lines_local(lines, filepath):
+    logging.debug("Saving file locally...")
+    init_local_directory(filepath)
+
+    # In the same directory, so that it can be renamed to filepath
+    temporary_path = "{0}.{1}.tmp".format(filepath, uuid.uuid4().hex)
+    try:
+        with open(temporary_path, "x") as output_file:
+            line_count = write_lines(lines, output_file)
+        os.replace(temporary_path, filepath)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return line_count
+
+
+def write_lines(lines, output_file):
+    line_count = 0
+    for line in lines:
+        output_file.write(line)
+        line_count += 1
+    return line_count
+
+
 def init_local_directory(filepath):
     dirname = os.path.dirname(filepath)
     if not os.path.exists(dirname):
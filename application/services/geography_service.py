@@ -1,4 +1,5 @@
 import logging
+import numpy
 import shapely.geometry
 import pyproj
 
@@ -38,47 +39,85 @@ def generate_grid(dycast_parameters):
     Returns a raster grid with points in the coordinate system as
     specified in global setting 'system-srid'
     '''
+    system_srid = CONFIG.get("system_srid")
+    grid_x, grid_y = generate_grid_coordinates(dycast_parameters)
+    return get_points_from_coordinates(grid_x, grid_y, system_srid)
+
+
+def generate_grid_coordinates(dycast_parameters):
+    '''
+    Returns the x and y coordinates of a raster grid as two arrays, in the coordinate
+    system as specified in global setting 'system-srid'. The grid covers the extent of
+    the dycast parameters with a step of 'grid_step' meters.
+    Gridpoint i is in column i // row count and row i % row count, see get_grid_row_count().
+    '''
+
+    system_srid = CONFIG.get("system_srid")
+    transformer_to_system_default = get_transformer(3857, system_srid)
+
+    logging.info("Started generating grid...")
+
+    x_values, y_values = get_grid_axis_values(dycast_parameters)
+
+    metric_x, metric_y = numpy.meshgrid(x_values, y_values, indexing='ij')
+    grid_x, grid_y = transformer_to_system_default.transform(metric_x.ravel(), metric_y.ravel())
+
+    grid_x = numpy.asarray(grid_x, dtype=numpy.float64)
+    grid_y = numpy.asarray(grid_y, dtype=numpy.float64)
+
+    logging.info("Done generating grid. Result: %s points", len(grid_x))
+
+    return grid_x, grid_y
 
+
+def get_grid_row_count(dycast_parameters):
+    x_values, y_values = get_grid_axis_values(dycast_parameters)
+    return len(y_values)
+
+
+def get_grid_axis_values(dycast_parameters):
+    '''
+    Returns the x values (west to east) and y values (north to south) of the grid, in meters (EPSG:3857)
+    '''
     srid_of_extent = dycast_parameters.srid_of_extent
     extent_min_x = dycast_parameters.extent_min_x
     extent_min_y = dycast_parameters.extent_min_y
     extent_max_x = dycast_parameters.extent_max_x
     extent_max_y = dycast_parameters.extent_max_y
 
-    system_srid = CONFIG.get("system_srid")
+    stepsize = dycast_parameters.grid_step
 
-    # Set up projections
-    projection_user_defined = pyproj.Proj(init="epsg:%s" % srid_of_extent)
-    projection_metric = pyproj.Proj(init='epsg:3857')  # metric; same as EPSG:900913
-    projection_system_default = pyproj.Proj(init="epsg:%s" % system_srid)
+    # Set up projections; 3857 is metric, same as EPSG:900913
+    transformer_to_metric = get_transformer(srid_of_extent, 3857)
 
-    # Create corners of rectangle to be transformed to a grid
-    north_west = shapely.geometry.Point((extent_min_x, extent_min_y))
-    south_east = shapely.geometry.Point((extent_max_x, extent_max_y))
+    # Project corners of rectangle (north-west and south-east) to 3857
+    start = transformer_to_metric.transform(extent_min_x, extent_min_y)
+    end = transformer_to_metric.transform(extent_max_x, extent_max_y)
 
-    stepsize = 100  # 100 meter grid step size
+    x_values = get_axis_values(start[0], end[0], stepsize)
+    y_values = get_axis_values(start[1], end[1], -stepsize)
+    return x_values, y_values
 
-    # Project corners to target projection
-    # Transform NW and SE points to 3857
-    start = pyproj.transform(projection_user_defined, projection_metric, north_west.x, north_west.y)
-    end = pyproj.transform(projection_user_defined, projection_metric, south_east.x, south_east.y)
 
-    # Iterate over 2D area
-    gridpoints = []
-    x = start[0]
-    logging.info("Started generating grid...")
-    while x < end[0]:
-        y = start[1]
-        while y > end[1]:
-            new_x, new_y = pyproj.transform(projection_metric, projection_system_default, x, y)
-            point = get_point_from_lat_long(new_y, new_x, system_srid)
-            gridpoints.append(point)
-            y -= stepsize
-        x += stepsize
-
-    logging.info("Done generating grid. Result: %s points", len(gridpoints))
-
-    return gridpoints
+def get_axis_values(start, end, step):
+    '''
+    Returns start, start + step, start + step + step, ... for as long as the values
+    are below end (or above end, for a negative step). The values are accumulated
+    one step at a time, so that they equal those of a loop that keeps adding step.
+    '''
+    count = int(abs((end - start) / step)) + 2
+    values = numpy.add.accumulate(numpy.concatenate(([start], numpy.full(count, float(step)))))
+    if step > 0:
+        return values[values < end]
+    return values[values > end]
+
+
+def get_transformer(source_srid, target_srid):
+    return pyproj.Transformer.from_crs("epsg:%s" % source_srid, "epsg:%s" % target_srid, always_xy=True)
+
+
+def get_points_from_coordinates(x, y, projection):
+    return [get_point_from_lat_long(float(point_y), float(point_x), projection) for point_x, point_y in zip(x, y)]
 
 
 def is_within_distance(point_1, point_2, distance):
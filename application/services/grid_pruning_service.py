@@ -0,0 +1,62 @@
+import numpy
+
+
+# Density bins are made slightly wider than the spatial domain, so that rounding can never
+# place a case within the spatial domain of a gridpoint more than one bin away from it
+BIN_SIZE_MARGIN = 1e-6
+
+
+def get_candidate_point_indices(grid_x, grid_y, case_x, case_y, spatial_domain, case_threshold):
+    """
+    Returns the indices (ascending) of the gridpoints that can have at least
+    `case_threshold` cases within `spatial_domain`.
+
+    Cases are counted in square bins at least as wide as the spatial domain, so all cases
+    within the spatial domain of a gridpoint lie in the 3x3 bins around the bin of that
+    gridpoint. The sum of those 9 bins is an upper bound of the case count of the gridpoint,
+    and gridpoints whose upper bound is below the threshold (or zero) can be skipped
+    without changing the result.
+    """
+    grid_x = numpy.asarray(grid_x, dtype=numpy.float64)
+    grid_y = numpy.asarray(grid_y, dtype=numpy.float64)
+    case_x = numpy.asarray(case_x, dtype=numpy.float64)
+    case_y = numpy.asarray(case_y, dtype=numpy.float64)
+
+    if not len(case_x) or not len(grid_x):
+        return numpy.empty(0, dtype=numpy.int64)
+
+    bin_size = max(float(spatial_domain), 1.0) * (1 + BIN_SIZE_MARGIN)
+    origin_x = case_x.min()
+    origin_y = case_y.min()
+
+    case_columns = numpy.floor((case_x - origin_x) / bin_size).astype(numpy.int64)
+    case_rows = numpy.floor((case_y - origin_y) / bin_size).astype(numpy.int64)
+    column_count = int(case_columns.max()) + 1
+    row_count = int(case_rows.max()) + 1
+
+    # Two bins of padding on each side: one for the 3x3 sums at the edges,
+    # and one for the gridpoints just outside the bins that hold cases
+    case_counts = numpy.zeros((column_count + 4, row_count + 4), dtype=numpy.int64)
+    numpy.add.at(case_counts, (case_columns + 2, case_rows + 2), 1)
+
+    neighbourhood_counts = numpy.zeros_like(case_counts)
+    for column_offset in (-1, 0, 1):
+        for row_offset in (-1, 0, 1):
+            neighbourhood_counts[1:-1, 1:-1] += case_counts[1 + column_offset:column_count + 3 + column_offset,
+                                                            1 + row_offset:row_count + 3 + row_offset]
+
+    grid_columns = get_bin_indices(grid_x, origin_x, bin_size) + 2
+    grid_rows = get_bin_indices(grid_y, origin_y, bin_size) + 2
+    is_inside = (grid_columns >= 1) & (grid_columns <= column_count + 2) & \
+                (grid_rows >= 1) & (grid_rows <= row_count + 2)
+
+    point_indices = numpy.flatnonzero(is_inside)
+    upper_bounds = neighbourhood_counts[grid_columns[point_indices], grid_rows[point_indices]]
+
+    return point_indices[upper_bounds >= max(case_threshold, 1)]
+
+
+def get_bin_indices(values, origin, bin_size):
+    # Clipped before casting: gridpoints far outside the bins are out of range either way
+    bin_indices = numpy.floor((values - origin) / bin_size)
+    return numpy.clip(bin_indices, -3, numpy.iinfo(numpy.int32).max).astype(numpy.int64)
@@ -0,0 +1,243 @@
+import hashlib
+import io
+import logging
+import os
+
+import numpy
+from geoalchemy2 import Geometry
+from sqlalchemy import Column, Integer, MetaData, Table, and_, exists, func, select, text
+
+from models.models import GridCell, GridPoint
+from services import config_service
+from services import geography_service
+
+
+CONFIG = config_service.get_config()
+
+TEMPORARY_GRID_TABLE_NAME = "run_grid_points"
+SELECTED_POINTS_TABLE_NAME = "selected_point_indices"
+
+
+def get_grid_key(dycast_parameters):
+    '''
+    Returns a key that identifies a grid by everything it is generated from:
+    the SRID and bounds of the extent, the system SRID and the grid step
+    '''
+    key_parts = (str(dycast_parameters.srid_of_extent),
+                 repr(float(dycast_parameters.extent_min_x)),
+                 repr(float(dycast_parameters.extent_min_y)),
+                 repr(float(dycast_parameters.extent_max_x)),
+                 repr(float(dycast_parameters.extent_max_y)),
+                 str(CONFIG.get("system_srid")),
+                 repr(float(dycast_parameters.grid_step)))
+    return hashlib.sha1("|".join(key_parts).encode("utf-8")).hexdigest()
+
+
+def get_grid_coordinates(session, dycast_parameters):
+    '''
+    Returns the x and y coordinates of the grid, like geography_service.generate_grid_coordinates(),
+    but memory-maps them from the grid cache directory if this grid was generated before, and the
+    cached grid has the point count and bounds of the grid in the grid_points table.
+    Without a grid cache directory the grid is always generated.
+    '''
+    grid_cache_directory = dycast_parameters.grid_cache_directory
+    if not grid_cache_directory:
+        return geography_service.generate_grid_coordinates(dycast_parameters)
+
+    grid_key = get_grid_key(dycast_parameters)
+    cache_file_path = os.path.join(grid_cache_directory, "grid_{0}.npy".format(grid_key))
+
+    if os.path.exists(cache_file_path):
+        logging.info("Loading cached grid: %s", cache_file_path)
+        coordinates = numpy.load(cache_file_path, mmap_mode='r')
+        if is_stored_grid(session, grid_key, coordinates[:, 0], coordinates[:, 1]):
+            logging.info("Done loading grid. Result: %s points", len(coordinates))
+            return coordinates[:, 0], coordinates[:, 1]
+        logging.warning("Cached grid does not match grid %s in the database, generating it again", grid_key)
+
+    grid_x, grid_y = geography_service.generate_grid_coordinates(dycast_parameters)
+    save_grid_coordinates(grid_x, grid_y, cache_file_path)
+    return grid_x, grid_y
+
+
+def is_stored_grid(session, grid_key, grid_x, grid_y):
+    '''
+    Returns True if the grid with grid_key is stored in the grid_points table, with
+    the same number of gridpoints and the same bounds as grid_x and grid_y
+    '''
+    (point_count, min_x, min_y, max_x, max_y) = session.query(func.count(GridPoint.point_index),
+                                                              func.min(func.ST_X(GridPoint.location)),
+                                                              func.min(func.ST_Y(GridPoint.location)),
+                                                              func.max(func.ST_X(GridPoint.location)),
+                                                              func.max(func.ST_Y(GridPoint.location))) \
+        .filter(GridPoint.grid_key == grid_key) \
+        .one()
+
+    if not point_count or point_count != len(grid_x):
+        return False
+    return (min_x, min_y, max_x, max_y) == (float(numpy.min(grid_x)), float(numpy.min(grid_y)),
+                                            float(numpy.max(grid_x)), float(numpy.max(grid_y)))
+
+
+def save_grid_coordinates(grid_x, grid_y, cache_file_path):
+    if not os.path.exists(os.path.dirname(cache_file_path)):
+        os.makedirs(os.path.dirname(cache_file_path))
+
+    # Write to a temporary file first, so that other runs never read a partial grid
+    temporary_file_path = "{0}.{1}.tmp".format(cache_file_path, os.getpid())
+    with open(temporary_file_path, 'wb') as cache_file:
+        numpy.save(cache_file, numpy.column_stack((grid_x, grid_y)))
+    os.replace(temporary_file_path, cache_file_path)
+    logging.info("Saved grid to cache: %s", cache_file_path)
+
+
+def get_tiles(grid_x, grid_y, tile_size):
+    '''
+    Splits the grid into square tiles of tile_size, ordered by row and column.
+    Returns a list with the gridpoint indices (ascending) of every tile that has gridpoints;
+    every gridpoint is in exactly one tile.
+    '''
+    grid_x = numpy.asarray(grid_x, dtype=numpy.float64)
+    grid_y = numpy.asarray(grid_y, dtype=numpy.float64)
+    if not len(grid_x):
+        return []
+
+    tile_columns = numpy.floor((grid_x - grid_x.min()) / tile_size).astype(numpy.int64)
+    tile_rows = numpy.floor((grid_y - grid_y.min()) / tile_size).astype(numpy.int64)
+    tile_keys = tile_rows * (int(tile_columns.max()) + 1) + tile_columns
+
+    order = numpy.argsort(tile_keys, kind='mergesort')
+    boundaries = numpy.flatnonzero(numpy.diff(tile_keys[order])) + 1
+    return numpy.split(order, boundaries)
+
+
+# Grid table
+
+def init_grid_table(session, grid_key, grid_x, grid_y, row_count):
+    '''
+    Stores the grid in the grid_points table (once per grid key), so that queries
+    can join against it and use its spatial index, and registers the locations of its
+    gridpoints as cells in the grid_cells table, so that risk can refer to them by cell ID.
+    A location that is already a cell, of this or any other grid, keeps its cell ID.
+
+    :param row_count: number of rows of the grid, see geography_service.get_grid_row_count()
+    '''
+    if session.query(exists().where(GridPoint.grid_key == grid_key)).scalar():
+        return
+
+    # Risk workers can store the same grid at the same time. The lock is released at commit.
+    session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:grid_key))"), {'grid_key': grid_key})
+    if session.query(exists().where(GridPoint.grid_key == grid_key)).scalar():
+        session.commit()
+        return
+
+    logging.info("Storing grid %s in the database...", grid_key)
+    copy_grid_points(session,
+                     "grid_points (grid_key, point_index, column_index, row_index, location)",
+                     ((grid_key, point_index, point_index // row_count, point_index % row_count, location)
+                      for (point_index, location) in get_grid_rows(grid_x, grid_y)))
+    session.execute(text("""
+        INSERT INTO grid_cells (lat, long)
+        SELECT ST_Y(location), ST_X(location)
+        FROM grid_points
+        WHERE grid_key = :grid_key
+        ON CONFLICT (lat, long) DO NOTHING
+        """), {'grid_key': grid_key})
+
+    session.execute(text("ANALYZE grid_points"))
+    session.execute(text("ANALYZE grid_cells"))
+    session.commit()
+    logging.info("Done storing grid")
+
+
+def get_cell_ids(session, grid_key):
+    '''
+    Returns the cell IDs of the gridpoints of a grid stored by init_grid_table(),
+    as an array indexed by point index
+    '''
+    rows = session.query(GridPoint.point_index, GridCell.cell_id) \
+        .join(GridCell, and_(GridCell.lat == func.ST_Y(GridPoint.location),
+                             GridCell.long == func.ST_X(GridPoint.location))) \
+        .filter(GridPoint.grid_key == grid_key) \
+        .all()
+
+    cell_ids = numpy.empty(len(rows), dtype=numpy.int64)
+    for (point_index, cell_id) in rows:
+        cell_ids[point_index] = cell_id
+    return cell_ids
+
+
+def get_points_query_from_grid_table(grid_key):
+    return select([GridPoint.point_index, GridPoint.location.label('point')]) \
+        .where(GridPoint.grid_key == grid_key) \
+        .alias('point_query')
+
+
+def init_temporary_grid_table(session, grid_x, grid_y):
+    '''
+    Stores the grid in a temporary table that is dropped at the end of the transaction and returns
+    a query on it, like get_points_query_from_grid_table(). Used for gridpoints that are not part of
+    a stored grid, so that the queries refer to them by name instead of embedding every point.
+    The table is emptied first if an earlier call of this transaction created it.
+    '''
+    system_srid = int(CONFIG.get("system_srid"))
+
+    session.execute(text("CREATE TEMPORARY TABLE IF NOT EXISTS {0} "
+                         "(point_index integer PRIMARY KEY, location geometry(Point, {1})) ON COMMIT DROP"
+                         .format(TEMPORARY_GRID_TABLE_NAME, system_srid)))
+    session.execute(text("TRUNCATE {0}".format(TEMPORARY_GRID_TABLE_NAME)))
+    copy_grid_points(session,
+                     "{0} (point_index, location)".format(TEMPORARY_GRID_TABLE_NAME),
+                     get_grid_rows(grid_x, grid_y))
+    session.execute(text("CREATE INDEX IF NOT EXISTS {0}_location_idx ON {0} USING GIST (location)"
+                         .format(TEMPORARY_GRID_TABLE_NAME)))
+    session.execute(text("ANALYZE {0}".format(TEMPORARY_GRID_TABLE_NAME)))
+
+    temporary_grid_table = Table(TEMPORARY_GRID_TABLE_NAME,
+                                 MetaData(),
+                                 Column('point_index', Integer, primary_key=True),
+                                 Column('location', Geometry('POINT', srid=system_srid)))
+    return select([temporary_grid_table.c.point_index, temporary_grid_table.c.location.label('point')]) \
+        .alias('point_query')
+
+
+def init_selected_points_table(session, point_indices):
+    '''
+    Stores point_indices in a temporary table that is dropped at the end of the transaction
+    and returns it, so that queries can join the gridpoints against it instead of embedding
+    every index. The table is emptied first if an earlier call of this transaction created it.
+    '''
+    session.execute(text("CREATE TEMPORARY TABLE IF NOT EXISTS {0} (point_index integer PRIMARY KEY) ON COMMIT DROP"
+                         .format(SELECTED_POINTS_TABLE_NAME)))
+    session.execute(text("TRUNCATE {0}".format(SELECTED_POINTS_TABLE_NAME)))
+    copy_grid_points(session,
+                     "{0} (point_index)".format(SELECTED_POINTS_TABLE_NAME),
+                     ((int(point_index),) for point_index in point_indices))
+    session.execute(text("ANALYZE {0}".format(SELECTED_POINTS_TABLE_NAME)))
+
+    return Table(SELECTED_POINTS_TABLE_NAME,
+                 MetaData(),
+                 Column('point_index', Integer, primary_key=True))
+
+
+def get_grid_rows(grid_x, grid_y):
+    '''
+    Yields (point_index, EWKT) for every gridpoint
+    '''
+    system_srid = CONFIG.get("system_srid")
+    for point_index, (x, y) in enumerate(zip(grid_x, grid_y)):
+        yield point_index, "SRID={0};POINT({1!r} {2!r})".format(system_srid, float(x), float(y))
+
+
+def copy_grid_points(session, table_and_columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(str(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert("COPY {0} FROM STDIN".format(table_and_columns), buffer)
+    finally:
+        cursor.close()
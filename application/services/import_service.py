@@ -1,13 +1,16 @@
+import io
 import logging
 import sys
 
-from sqlalchemy import exists
+from sqlalchemy import any_, exists, text
+from sqlalchemy.dialects.postgresql import array
 from sqlalchemy.exc import SQLAlchemyError
 
 from services import config_service
 from services import file_service
 from services import database_service
 from services import geography_service
+from services import partition_service
 
 from models.models import Case
 from models.enums import enums
@@ -15,6 +18,12 @@ from models.enums import enums
 
 CONFIG = config_service.get_config()
 
+# Number of lines that are parsed and streamed to the staging table in one COPY
+COPY_CHUNK_SIZE = 50000
+
+# Number of lines whose case IDs are checked for duplicates in one query
+DUPLICATE_CHECK_CHUNK_SIZE = 1000
+
 
 class ImportService(object):
 
@@ -28,14 +37,15 @@ class ImportService(object):
         for filepath in dycast_parameters.files_to_import:
             try:
                 logging.info("Loading file: %s", filepath)
-                self.load_case_file(dycast_parameters, filepath)
+                if dycast_parameters.bulk_import:
+                    self.load_case_file_bulk(dycast_parameters, filepath)
+                else:
+                    self.load_case_file(dycast_parameters, filepath)
             except Exception:
                 logging.exception("Could not load file: %s", filepath)
                 raise
 
     def load_case_file(self, dycast_parameters, filename):
-        session = database_service.get_sqlalchemy_session()
-
         lines_read = 0
         lines_processed = 0
         lines_loaded = 0
@@ -48,58 +58,197 @@ class ImportService(object):
             logging.exception("Could not read file: %s", filename)
             raise
 
+        known_case_ids = set()
+        cases = []
+
         try:
-            for line_number, line in enumerate(input_file):
-                line = remove_trailing_newline(line)
-                if line_number == 0:
-                    header_count = line.count("\t") + 1
-                    if header_count == 4:
-                        location_type = enums.Location_type.LAT_LONG
-                    elif header_count == 3:
-                        location_type = enums.Location_type.GEOMETRY
-                    else:
-                        raise ValueError("Incorrect column count: {header_count}, exiting...".format(header_count=header_count))
-                    logging.info("Loading cases as location type: %s", enums.Location_type(location_type).name)
-                else:
-                    lines_read += 1
-                    result = 0
-                    try:
-                        result = self.load_case(session, dycast_parameters, line, location_type)
-                    except Exception:
-                        raise
-
-                    # If result is a case ID or -1 (meaning duplicate) then:
-                    lines_processed += 1
-                    if result == -1:
-                        lines_skipped += 1
+            with database_service.session_scope() as session:
+                for line_number, line in enumerate(input_file):
+                    line = remove_trailing_newline(line)
+                    if line_number == 0:
+                        location_type = get_location_type_from_header(line)
                     else:
-                        lines_loaded += 1
+                        lines_read += 1
+                        cases.append(self.get_case_from_line(dycast_parameters, line, location_type))
+
+                        if len(cases) == DUPLICATE_CHECK_CHUNK_SIZE:
+                            (loaded, skipped) = self.load_cases(session, cases, known_case_ids)
+                            lines_processed += len(cases)
+                            lines_loaded += loaded
+                            lines_skipped += skipped
+                            cases = []
+
+                if cases:
+                    (loaded, skipped) = self.load_cases(session, cases, known_case_ids)
+                    lines_processed += len(cases)
+                    lines_loaded += loaded
+                    lines_skipped += skipped
+
+                # The dates are parsed by the database, so the cases are first written to the
+                # default partition, and moved to the partitions of their months from there
+                partition_service.move_rows_from_default_partition(session, 'cases')
+        except SQLAlchemyError as e:
+            logging.exception("Couldn't insert cases")
+            logging.exception(e)
+            raise
         finally:
             input_file.close()
 
+        logging.info("Case load complete: %s", filename)
+        logging.info("Processed %s of %s lines, %s loaded, %s duplicate IDs skipped",
+                     lines_processed, lines_read, lines_loaded, lines_skipped)
+        return lines_read, lines_processed, lines_loaded, lines_skipped
+
+
+    def load_case_file_bulk(self, dycast_parameters, filename):
+        """
+        Bulk alternative to load_case_file(): streams the file in chunks into a temporary
+        staging table with COPY, then inserts all staged cases into the cases table with one
+        set-based statement, skipping IDs that already exist.
+        """
+        lines_read = 0
+        location_type = ""
+
         try:
-            session.commit()
+            input_file = file_service.read_file(filename)
+        except Exception:
+            logging.exception("Could not read file: %s", filename)
+            raise
+
+        try:
+            with database_service.session_scope() as session:
+                for line_number, line in enumerate(input_file):
+                    line = remove_trailing_newline(line)
+                    if line_number == 0:
+                        location_type = get_location_type_from_header(line)
+                        self.create_case_staging_table(session, dycast_parameters, location_type)
+                        chunk = io.StringIO()
+                        chunk_size = 0
+                    else:
+                        lines_read += 1
+                        if line.count("\t") + 1 != get_column_count(location_type):
+                            fail_on_incorrect_count(location_type, line, ValueError("Incorrect number of fields"))
+                        chunk.write(line)
+                        chunk.write("\n")
+                        chunk_size += 1
+
+                        if chunk_size == COPY_CHUNK_SIZE:
+                            self.copy_to_case_staging_table(session, chunk, location_type)
+                            chunk = io.StringIO()
+                            chunk_size = 0
+
+                if lines_read:
+                    if chunk_size:
+                        self.copy_to_case_staging_table(session, chunk, location_type)
+                    self.create_case_partitions_for_staging_table(session)
+                    lines_loaded = self.insert_cases_from_staging_table(session, dycast_parameters, location_type)
+                else:
+                    lines_loaded = 0
         except SQLAlchemyError as e:
-            session.rollback()
             logging.exception("Couldn't insert cases")
             logging.exception(e)
             raise
         finally:
-            session.close()
+            input_file.close()
+
+        lines_processed = lines_read
+        lines_skipped = lines_processed - lines_loaded
+        if lines_skipped:
+            logging.warning("Couldn't insert %s duplicate case keys, skipped", lines_skipped)
 
         logging.info("Case load complete: %s", filename)
         logging.info("Processed %s of %s lines, %s loaded, %s duplicate IDs skipped",
                      lines_processed, lines_read, lines_loaded, lines_skipped)
         return lines_read, lines_processed, lines_loaded, lines_skipped
 
+    def create_case_staging_table(self, session, dycast_parameters, location_type):
+        if location_type == enums.Location_type.LAT_LONG:
+            if dycast_parameters.srid_of_cases is None:
+                raise ValueError(
+                    "Parameter 'user_coordinate_system' cannot be undefined when loading cases with lat/long locations")
+            columns = "id integer, report_date date, long double precision, lat double precision"
+        else:
+            columns = "id integer, report_date date, location text"
+
+        # line_number keeps the order of the file, so that the first of duplicate IDs is loaded
+        session.execute(text("CREATE TEMPORARY TABLE cases_staging ({0}, line_number bigserial) ON COMMIT DROP"
+                             .format(columns)))
+
+    def copy_to_case_staging_table(self, session, chunk, location_type):
+        chunk.seek(0)
+        cursor = session.connection().connection.cursor()
+        try:
+            cursor.copy_expert("COPY cases_staging ({0}) FROM STDIN".format(get_staging_column_names(location_type)),
+                               chunk)
+        finally:
+            cursor.close()
+
+    def create_case_partitions_for_staging_table(self, session):
+        (startdate, enddate) = session.execute(text("SELECT min(report_date), max(report_date) FROM cases_staging")) \
+            .first()
+        if startdate is not None:
+            partition_service.ensure_monthly_partitions(session, 'cases', startdate, enddate)
+
+    def insert_cases_from_staging_table(self, session, dycast_parameters, location_type):
+        if location_type == enums.Location_type.LAT_LONG:
+            location = "ST_Transform(ST_SetSRID(ST_MakePoint(long, lat), :srid_of_cases), :system_srid)"
+        else:
+            location = "location::geometry"
+
+        result = session.execute(text("""
+            INSERT INTO cases (id, report_date, location)
+            SELECT DISTINCT ON (id) id, report_date, {0}
+            FROM cases_staging
+            WHERE NOT EXISTS (SELECT 1 FROM cases WHERE cases.id = cases_staging.id)
+            ORDER BY id, line_number
+            """.format(location)),
+            {'srid_of_cases': int(dycast_parameters.srid_of_cases or 0), 'system_srid': int(self.system_srid)})
+        return result.rowcount
+
+    def load_cases(self, session, cases, known_case_ids):
+        """
+        Adds a chunk of cases to the session, skipping the ones whose ID is already in the
+        database or earlier in the same import. Duplicates in the database are looked up
+        with one query per chunk.
+
+        :param known_case_ids: set of IDs seen earlier in this import, updated in place
+        :return: tuple of (cases loaded, cases skipped)
+        """
+        chunk_case_ids = set(int(case.id) for case in cases) - known_case_ids
+        existing_case_ids = get_existing_case_ids(session, chunk_case_ids)
+
+        loaded = 0
+        skipped = 0
+        for case in cases:
+            case_id = int(case.id)
+            if case_id in known_case_ids or case_id in existing_case_ids:
+                logging.warning("Couldn't insert duplicate case key %s, skipping...", case.id)
+                skipped += 1
+            else:
+                session.add(case)
+                loaded += 1
+            known_case_ids.add(case_id)
+
+        session.flush()
+        return loaded, skipped
 
     def load_case(self, session, dycast_parameters, line, location_type):
 
+        case = self.get_case_from_line(dycast_parameters, line, location_type)
+
+        if not case_exists(session, case.id):
+            session.add(case)
+            session.flush()
+            return 1
+        else:
+            logging.warning("Couldn't insert duplicate case key %s, skipping...", case.id)
+            return -1
+
+    def get_case_from_line(self, dycast_parameters, line, location_type):
+
         if location_type not in (enums.Location_type.LAT_LONG, enums.Location_type.GEOMETRY):
             raise ValueError("Wrong value for 'location_type', exiting...")
 
-        case = Case()
-
         if location_type == enums.Location_type.LAT_LONG:
             user_coordinate_system = dycast_parameters.srid_of_cases
             if user_coordinate_system is None:
@@ -113,7 +262,7 @@ class ImportService(object):
             point = geography_service.get_point_from_lat_long(lat, lon, user_coordinate_system)
             projected_point = geography_service.transform_point(point, self.system_srid)
 
-            case = Case(id=case_id, report_date=report_date, location=projected_point)
+            return Case(id=case_id, report_date=report_date, location=projected_point)
 
         else:
             try:
@@ -121,18 +270,31 @@ class ImportService(object):
             except ValueError as e:
                 fail_on_incorrect_count(location_type, line, e)
 
-            case = Case(id=case_id, report_date=report_date, location=geometry)
+            return Case(id=case_id, report_date=report_date, location=geometry)
 
-        if not case_exists(session, case_id):
-            session.add(case)
-            session.flush()
-            return 1
-        else:
-            logging.warning("Couldn't insert duplicate case key %s, skipping...", case_id)
-            return -1
 
 
 
+def get_location_type_from_header(line):
+    header_count = line.count("\t") + 1
+    if header_count == 4:
+        location_type = enums.Location_type.LAT_LONG
+    elif header_count == 3:
+        location_type = enums.Location_type.GEOMETRY
+    else:
+        raise ValueError("Incorrect column count: {header_count}, exiting...".format(header_count=header_count))
+    logging.info("Loading cases as location type: %s", enums.Location_type(location_type).name)
+    return location_type
+
+def get_column_count(location_type):
+    if location_type == enums.Location_type.LAT_LONG:
+        return 4
+    return 3
+
+def get_staging_column_names(location_type):
+    if location_type == enums.Location_type.LAT_LONG:
+        return "id, report_date, long, lat"
+    return "id, report_date, location"
 
 def fail_on_incorrect_count(location_type, line, exception):
     logging.error("Incorrect number of fields for 'location_type': %s",
@@ -145,3 +307,9 @@ def remove_trailing_newline(line):
 
 def case_exists(session, case_id):
     return session.query(exists().where(Case.id == case_id)).scalar()
+
+def get_existing_case_ids(session, case_ids):
+    if not case_ids:
+        return set()
+    rows = session.query(Case.id).filter(Case.id == any_(array(list(case_ids)))).all()
+    return set(row.id for row in rows)
@@ -0,0 +1,88 @@
+import collections
+import contextlib
+import json
+import logging
+import time
+
+
+class Instrumentation(object):
+    """
+    Per-day timers and counters for the stages of risk generation.
+
+    Call start_day() before and finish_day() after every day; timer() and count()
+    record into the current day, and do nothing outside of a day.
+    """
+
+    def __init__(self):
+        self._current = None
+        self._start_time = None
+
+    def start_day(self, day):
+        self._current = collections.OrderedDict()
+        self._current['risk_date'] = day.isoformat()
+        self._current['total_seconds'] = 0.0
+        self._start_time = time.time()
+
+    def finish_day(self):
+        """
+        :return: the record of the current day: an ordered dict with the risk date,
+            the seconds per stage ('<stage>_seconds') and the counters
+        """
+        record = self._current
+        record['total_seconds'] = time.time() - self._start_time
+        self._current = None
+        return record
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            if self._current is not None:
+                key = "{0}_seconds".format(stage)
+                self._current[key] = self._current.get(key, 0.0) + time.time() - start_time
+
+    def count(self, counter, value=1):
+        if self._current is not None:
+            self._current[counter] = self._current.get(counter, 0) + int(value)
+
+
+def log_summary(records):
+    """
+    Logs the records of finish_day() as a table, with one row per day and a row with totals
+    """
+    if not records:
+        return
+
+    columns = []
+    for record in records:
+        for column in record:
+            if column not in columns:
+                columns.append(column)
+
+    totals = collections.OrderedDict((column, sum(record.get(column, 0) for record in records))
+                                     for column in columns[1:])
+    totals['risk_date'] = 'total'
+    rows = list(records) + [totals]
+
+    widths = [max(len(column), max(len(format_value(row.get(column, 0))) for row in rows)) for column in columns]
+
+    logging.info("Risk generation stages:")
+    logging.info("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        logging.info("  ".join(format_value(row.get(column, 0)).rjust(width) for column, width in zip(columns, widths)))
+
+
+def write_json_lines(records, filepath):
+    with open(filepath, 'a') as output_file:
+        for record in records:
+            output_file.write(json.dumps(record))
+            output_file.write("\n")
+    logging.info("Wrote risk generation stages to: %s", filepath)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return "{0:.3f}".format(value)
+    return str(value)
@@ -11,7 +11,8 @@ CONFIG = config_service.get_config()
 def init_logging():
     root_logger = logging.getLogger()
 
-    log_format = "%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s"
+    # Risk worker processes append to the same log file, the process ID tells their lines apart
+    log_format = "%(asctime)s [%(process)-6d] [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s"
     log_formatter = logging.Formatter(log_format)
 
     log_level = get_log_level()
@@ -70,3 +71,7 @@ def get_log_file_path():
     log_dir = CONFIG.get("logfile")
     root_dir = config_service.get_application_directory()
     return os.path.join(root_dir, log_dir)
+
+def get_stages_file_path():
+    log_file_path = get_log_file_path()
+    return os.path.splitext(log_file_path)[0] + "_stages.jsonl"
@@ -0,0 +1,337 @@
+import datetime
+import logging
+
+import numpy
+import shapely.geometry
+from sqlalchemy import func
+
+from models.classes.case_table import CaseTable
+from models.classes.cluster import Cluster
+from models.models import Case
+from services.spatial_index_service import BucketIndex, get_distance
+
+
+class MemoryClusterService(object):
+    """
+    In-memory alternative to RiskService.get_clusters_per_point_query():
+    loads the cases of the temporal window once per day and looks up the
+    gridpoints within the spatial domain of each case in a bucket index,
+    instead of cross joining every gridpoint with the cases table in PostGIS.
+
+    Arguments:
+        dycast_parameters {DycastParameters} -- instance of DycastParameters class
+        grid_x {array} -- x coordinates of the gridpoints, see geography_service.generate_grid_coordinates()
+        grid_y {array} -- y coordinates of the gridpoints
+    """
+
+    def __init__(self, dycast_parameters, grid_x, grid_y):
+        self.dycast_parameters = dycast_parameters
+
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.grid_index = BucketIndex(self.grid_x, self.grid_y, dycast_parameters.spatial_domain)
+        logging.info("Built in-memory index of %s gridpoints", len(self.grid_index))
+
+    def get_clusters_per_point(self, session, riskdate):
+        case_table = self.get_case_table(session, riskdate)
+        point_indices, case_indices = self.get_point_case_pairs(case_table)
+        return self.get_clusters_from_pairs(case_table, point_indices, case_indices)
+
+    def get_case_table(self, session, riskdate):
+        days_prev = self.dycast_parameters.temporal_domain
+        enddate = riskdate
+        startdate = riskdate - datetime.timedelta(days=(days_prev))
+
+        return self.get_case_table_for_dates(session, startdate, enddate)
+
+    def get_case_table_for_dates(self, session, startdate, enddate):
+        rows = session.query(Case.id,
+                             Case.report_date,
+                             func.ST_X(Case.location),
+                             func.ST_Y(Case.location)) \
+            .filter(Case.report_date >= startdate,
+                    Case.report_date <= enddate) \
+            .all()
+
+        return CaseTable.from_rows(rows)
+
+    def get_point_case_pairs(self, case_table):
+        """
+        Returns two equally long arrays of gridpoint indices and case indices,
+        one entry for every case that lies within the spatial domain of a gridpoint,
+        sorted by gridpoint
+        """
+        spatial_domain = self.dycast_parameters.spatial_domain
+        point_chunks = []
+        case_chunks = []
+
+        for case_index in range(len(case_table)):
+            point_indices = self.grid_index.query_radius(case_table.x[case_index],
+                                                         case_table.y[case_index],
+                                                         spatial_domain)
+            if len(point_indices):
+                point_chunks.append(point_indices)
+                case_chunks.append(numpy.full(len(point_indices), case_index, dtype=numpy.int64))
+
+        if not point_chunks:
+            return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64)
+
+        point_indices = numpy.concatenate(point_chunks)
+        case_indices = numpy.concatenate(case_chunks)
+
+        order = numpy.argsort(point_indices, kind='mergesort')
+        return point_indices[order], case_indices[order]
+
+    def get_clusters_from_pairs(self, case_table, point_indices, case_indices):
+        clusters_per_point = []
+        if not len(point_indices):
+            return clusters_per_point
+
+        boundaries = numpy.flatnonzero(numpy.diff(point_indices)) + 1
+        starts = numpy.concatenate(([0], boundaries))
+        ends = numpy.concatenate((boundaries, [len(point_indices)]))
+
+        for start, end in zip(starts, ends):
+            point_index = point_indices[start]
+
+            cluster = Cluster()
+            cluster.point = shapely.geometry.Point(self.grid_x[point_index], self.grid_y[point_index])
+            cluster.point_index = int(point_index)
+            cluster.case_table = case_table
+            cluster.case_indices = case_indices[start:end]
+            cluster.case_count = cluster.get_case_count()
+
+            clusters_per_point.append(cluster)
+
+        return clusters_per_point
+
+
+class IncrementalClusterService(MemoryClusterService):
+    """
+    Sliding-window variant of MemoryClusterService for consecutive risk dates.
+
+    Keeps the cases of the temporal window in memory, and when moving to the next day
+    only fetches the cases that enter the window and drops the ones that leave it.
+    The cases are stored once, in a CaseTable that the clusters refer to by index (slot).
+
+    The close space/time counts of every gridpoint are kept up to date with only the pairs
+    of the cases that enter or leave, so the clusters come with their counts:
+    close in time from the number of cases per day of every gridpoint, close in space
+    from the cases within close_in_space of the entering or leaving case.
+    The Cluster objects of gridpoints without entering or leaving cases are returned
+    as they were, including their probability.
+
+    Arguments:
+        dycast_parameters {DycastParameters} -- instance of DycastParameters class
+        grid_x {array} -- x coordinates of the gridpoints, see geography_service.generate_grid_coordinates()
+        grid_y {array} -- y coordinates of the gridpoints
+    """
+
+    def __init__(self, dycast_parameters, grid_x, grid_y):
+        super().__init__(dycast_parameters, grid_x, grid_y)
+        self.window_length = int(dycast_parameters.temporal_domain) + 1
+        self.reset_window()
+
+    def reset_window(self):
+        self.window_startdate = None
+        self.window_enddate = None
+
+        # Cases that left the window keep their slot, marked as not live, until compact_case_table()
+        self.case_table = CaseTable()
+        self.is_live = numpy.zeros(0, dtype=bool)
+        self.point_indices_per_slot = {}
+        self.slots_per_day = {}
+        self.slots_per_point = {}
+        self.slots_per_id = {}
+
+        # Number of cases per gridpoint and day of the window, in column day ordinal % window length
+        self.case_counts_per_day = numpy.zeros((len(self.grid_x), self.window_length), dtype=numpy.int32)
+        # Close in space, close in time, and close in space and time pairs per gridpoint
+        self.close_pair_counts = numpy.zeros((len(self.grid_x), 3), dtype=numpy.int64)
+
+        self.clusters = {}
+        self.changed_points = set()
+
+    def get_clusters_per_point(self, session, riskdate):
+        delta = datetime.timedelta(days=1)
+        days_prev = self.dycast_parameters.temporal_domain
+        startdate = riskdate - datetime.timedelta(days=(days_prev))
+
+        if self.window_enddate is None \
+                or riskdate <= self.window_enddate \
+                or startdate > self.window_enddate + delta:
+            self.reset_window()
+            cases_removed = 0
+            cases_added = self.add_cases(session, startdate, riskdate, startdate)
+        else:
+            cases_removed = self.remove_cases_before(startdate)
+            if len(self.case_table) > 2 * len(self.point_indices_per_slot):
+                self.compact_case_table()
+            cases_added = self.add_cases(session, self.window_enddate + delta, riskdate, startdate)
+
+        self.window_startdate = startdate
+        self.window_enddate = riskdate
+
+        changed_point_count = len(self.changed_points)
+        self.update_changed_clusters()
+
+        logging.info("Sliding window %s - %s: %s cases entered, %s cases left, %s gridpoints changed",
+                     startdate, riskdate, cases_added, cases_removed, changed_point_count)
+
+        return list(self.clusters.values())
+
+    def add_cases(self, session, startdate, enddate, window_startdate):
+        """
+        Adds the cases reported from startdate up to and including enddate, to the window
+        from window_startdate up to and including enddate
+        """
+        case_table = self.get_case_table_for_dates(session, startdate, enddate)
+        spatial_domain = self.dycast_parameters.spatial_domain
+
+        first_slot = len(self.case_table)
+        self.case_table = CaseTable(numpy.concatenate((self.case_table.ids, case_table.ids)),
+                                    numpy.concatenate((self.case_table.report_days, case_table.report_days)),
+                                    numpy.concatenate((self.case_table.x, case_table.x)),
+                                    numpy.concatenate((self.case_table.y, case_table.y)))
+        self.is_live = numpy.concatenate((self.is_live, numpy.zeros(len(case_table), dtype=bool)))
+
+        for case_index in range(len(case_table)):
+            slot = first_slot + case_index
+            point_indices = self.grid_index.query_radius(case_table.x[case_index],
+                                                         case_table.y[case_index],
+                                                         spatial_domain)
+
+            self.update_close_pair_counts(slot, point_indices, window_startdate, enddate, 1)
+
+            self.is_live[slot] = True
+            self.case_counts_per_day[point_indices, self.get_day_column(slot)] += 1
+            self.point_indices_per_slot[slot] = point_indices
+            self.slots_per_day.setdefault(case_table.get_report_date(case_index), []).append(slot)
+            self.slots_per_id.setdefault(int(case_table.ids[case_index]), []).append(slot)
+
+            for point_index in point_indices:
+                self.slots_per_point.setdefault(point_index, set()).add(slot)
+            self.changed_points.update(point_indices)
+
+        return len(case_table)
+
+    def remove_cases_before(self, startdate):
+        cases_removed = 0
+        for day in sorted(day for day in self.slots_per_day if day < startdate):
+            for slot in self.slots_per_day.pop(day):
+                point_indices = self.point_indices_per_slot.pop(slot)
+
+                self.is_live[slot] = False
+                self.case_counts_per_day[point_indices, self.get_day_column(slot)] -= 1
+                self.slots_per_id[int(self.case_table.ids[slot])].remove(slot)
+                for point_index in point_indices:
+                    self.slots_per_point[point_index].discard(slot)
+                self.changed_points.update(point_indices)
+
+                self.update_close_pair_counts(slot, point_indices, self.window_startdate, self.window_enddate, -1)
+                cases_removed += 1
+        return cases_removed
+
+    def update_close_pair_counts(self, slot, point_indices, window_startdate, window_enddate, sign):
+        """
+        Adds (sign 1) or subtracts (sign -1) the close pairs of the case in slot and the live cases
+        of the window to the counts of the gridpoints they share, with the rules of
+        pair_count_service.count_close_pairs(). The case in slot itself must not be live.
+        """
+        if not len(point_indices):
+            return
+
+        case_table = self.case_table
+        close_in_time = self.dycast_parameters.close_in_time
+        report_day = case_table.report_days[slot]
+
+        # Close in time: the cases of the days within close_in_time, that are in the window
+        first_day = max(report_day - close_in_time, window_startdate.toordinal())
+        last_day = min(report_day + close_in_time, window_enddate.toordinal())
+        if first_day <= last_day:
+            columns = numpy.arange(first_day, last_day + 1) % self.window_length
+            close_in_time_counts = self.case_counts_per_day[point_indices[:, None], columns[None, :]].sum(axis=1)
+            self.close_pair_counts[point_indices, 1] += sign * close_in_time_counts
+
+        # Cases with the same ID are no pair
+        for other_slot in self.slots_per_id.get(int(case_table.ids[slot]), ()):
+            if abs(case_table.report_days[other_slot] - report_day) <= close_in_time:
+                shared_points = numpy.intersect1d(point_indices, self.point_indices_per_slot[other_slot],
+                                                  assume_unique=True)
+                self.close_pair_counts[shared_points, 1] -= sign
+
+        # Close in space, and in space and time
+        live_slots = numpy.flatnonzero(self.is_live)
+        distance = get_distance(case_table.x[slot], case_table.y[slot], case_table.x[live_slots], case_table.y[live_slots])
+        neighbours = live_slots[(distance < self.dycast_parameters.close_in_space) &
+                                (case_table.ids[live_slots] != case_table.ids[slot])]
+        for other_slot in neighbours:
+            shared_points = numpy.intersect1d(point_indices, self.point_indices_per_slot[other_slot],
+                                              assume_unique=True)
+            self.close_pair_counts[shared_points, 0] += sign
+            if abs(case_table.report_days[other_slot] - report_day) <= close_in_time:
+                self.close_pair_counts[shared_points, 2] += sign
+
+    def get_day_column(self, slot):
+        return int(self.case_table.report_days[slot]) % self.window_length
+
+    def compact_case_table(self):
+        """
+        Drops the slots of the cases that left the window from the case table. Every gridpoint
+        gets a new Cluster, with the new slots; the counts and probabilities stay the same.
+        """
+        slots = numpy.flatnonzero(self.is_live)
+        new_slots = numpy.full(len(self.case_table), -1, dtype=numpy.int64)
+        new_slots[slots] = numpy.arange(len(slots))
+
+        case_table = self.case_table
+        self.case_table = CaseTable(case_table.ids[slots],
+                                    case_table.report_days[slots],
+                                    case_table.x[slots],
+                                    case_table.y[slots])
+        self.is_live = numpy.ones(len(slots), dtype=bool)
+
+        self.point_indices_per_slot = {int(new_slots[slot]): point_indices
+                                       for (slot, point_indices) in self.point_indices_per_slot.items()}
+        self.slots_per_day = {day: [int(new_slots[slot]) for slot in day_slots]
+                              for (day, day_slots) in self.slots_per_day.items()}
+        self.slots_per_id = {case_id: [int(new_slots[slot]) for slot in id_slots]
+                             for (case_id, id_slots) in self.slots_per_id.items() if id_slots}
+        self.slots_per_point = {point_index: set(int(new_slots[slot]) for slot in point_slots)
+                                for (point_index, point_slots) in self.slots_per_point.items()}
+        self.changed_points.update(self.slots_per_point)
+
+    def update_changed_clusters(self):
+        for point_index in self.changed_points:
+            slots = self.slots_per_point.get(point_index)
+
+            if not slots:
+                self.slots_per_point.pop(point_index, None)
+                self.clusters.pop(point_index, None)
+                continue
+
+            cluster = Cluster()
+            cluster.point = shapely.geometry.Point(self.grid_x[point_index], self.grid_y[point_index])
+            cluster.point_index = int(point_index)
+            cluster.case_indices = numpy.array(sorted(slots), dtype=numpy.int64)
+            cluster.case_count = cluster.get_case_count()
+            (cluster.close_in_space,
+             cluster.close_in_time,
+             cluster.close_space_and_time) = (int(count) for count in self.close_pair_counts[point_index])
+
+            # The probability only depends on the case count and the close pair counts
+            previous_cluster = self.clusters.get(point_index)
+            if previous_cluster is not None and get_probability_key(previous_cluster) == get_probability_key(cluster):
+                cluster.cumulative_probability = previous_cluster.cumulative_probability
+
+            self.clusters[point_index] = cluster
+
+        # Slots do not change between compactions, so all clusters can refer to the latest table
+        for cluster in self.clusters.values():
+            cluster.case_table = self.case_table
+
+        self.changed_points = set()
+
+
+def get_probability_key(cluster):
+    return (cluster.case_count, cluster.close_in_space, cluster.close_in_time, cluster.close_space_and_time)
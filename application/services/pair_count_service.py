@@ -0,0 +1,257 @@
+import numpy
+
+from services.spatial_index_service import BucketIndex, get_distance
+
+
+# Pairs are compared in square blocks of at most BLOCK_SIZE x BLOCK_SIZE cases,
+# which keeps memory bounded for very large clusters
+BLOCK_SIZE = 512
+
+# A ClosePairGraph is only built when the clusters share their cases and are large enough for the
+# pairwise comparisons to outweigh building the graph. In benchmarks/results/close_pair_graph_thresholds.json
+# (stages close_space_and_time and close_space_and_time_graph) counting per cluster was faster up to a mean
+# of about 47 cases per cluster and the graph from about 60, with every case in 25 to 200 clusters.
+# Those runs do not cover clusters without shared cases, for which the graph compares the same pairs
+# as counting per cluster and only adds the cost of building it: hence the minimum overlap.
+MIN_MEAN_CLUSTER_SIZE_FOR_GRAPH = 56
+MIN_CLUSTER_OVERLAP_FOR_GRAPH = 2
+
+
+def count_close_pairs(ids, x, y, report_days, close_in_space, close_in_time, block_size=BLOCK_SIZE):
+    """
+    Counts the pairs of cases that are close in space, close in time and close in both.
+
+    Every pair of cases with different ids is counted once. A pair is close in space when
+    the distance between the cases is strictly less than `close_in_space`, and close in time
+    when their report dates are at most `close_in_time` days apart.
+
+    :param ids: case ids
+    :param x: x coordinates of the cases
+    :param y: y coordinates of the cases
+    :param report_days: report dates of the cases as day ordinals
+    :return: tuple of (close_in_space, close_in_time, close_space_and_time)
+    """
+    ids = numpy.asarray(ids, dtype=numpy.int64)
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    report_days = numpy.asarray(report_days, dtype=numpy.int64)
+
+    case_count = len(ids)
+    close_in_space_count = 0
+    close_in_time_count = 0
+    close_space_and_time_count = 0
+
+    for row_start in range(0, case_count, block_size):
+        row_end = min(row_start + block_size, case_count)
+        rows = slice(row_start, row_end)
+
+        for column_start in range(row_start, case_count, block_size):
+            column_end = min(column_start + block_size, case_count)
+            columns = slice(column_start, column_end)
+
+            is_pair = ids[rows, None] != ids[None, columns]
+            if column_start == row_start:
+                is_pair &= numpy.arange(row_start, row_end)[:, None] < numpy.arange(column_start, column_end)[None, :]
+
+            distance = get_distance(x[rows, None], y[rows, None], x[None, columns], y[None, columns])
+            is_close_in_space = is_pair & (distance < close_in_space)
+            is_close_in_time = is_pair & (numpy.abs(report_days[rows, None] - report_days[None, columns]) <= close_in_time)
+
+            close_in_space_count += int(numpy.count_nonzero(is_close_in_space))
+            close_in_time_count += int(numpy.count_nonzero(is_close_in_time))
+            close_space_and_time_count += int(numpy.count_nonzero(is_close_in_space & is_close_in_time))
+
+    return close_in_space_count, close_in_time_count, close_space_and_time_count
+
+
+class ClosePairGraph(object):
+    """
+    Edge list of all pairs of cases that are close in space, built once for a set of cases
+    (e.g. all cases of one day), so that the close space/time counts of every cluster can
+    be read from the subgraph induced by its cases instead of comparing all its pairs.
+
+    Edges are stored once, from the lower to the higher case index, in compressed sparse
+    row layout, with a flag telling whether the pair is also close in time.
+
+    Arguments:
+        ids {array} -- case ids
+        x {array} -- x coordinates of the cases
+        y {array} -- y coordinates of the cases
+        report_days {array} -- report dates of the cases as day ordinals
+        close_in_space {float} -- distance under which two cases are close in space
+        close_in_time {int} -- number of days within which two cases are close in time
+    """
+
+    def __init__(self, ids, x, y, report_days, close_in_space, close_in_time):
+        self.ids = numpy.asarray(ids, dtype=numpy.int64)
+        self.report_days = numpy.asarray(report_days, dtype=numpy.int64)
+        self.close_in_time = close_in_time
+
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        case_count = len(self.ids)
+
+        edge_counts = numpy.zeros(case_count, dtype=numpy.int64)
+        target_chunks = []
+
+        if close_in_space > 0:
+            index = BucketIndex(x, y, close_in_space)
+            for case_index in range(case_count):
+                neighbours = index.query_radius(x[case_index], y[case_index], close_in_space, strict=True)
+                neighbours = neighbours[neighbours > case_index]
+                neighbours = neighbours[self.ids[neighbours] != self.ids[case_index]]
+                edge_counts[case_index] = len(neighbours)
+                target_chunks.append(neighbours)
+
+        self.edge_offsets = numpy.concatenate(([0], numpy.cumsum(edge_counts))).astype(numpy.int64)
+        if target_chunks:
+            self.edge_targets = numpy.concatenate(target_chunks).astype(numpy.int64)
+        else:
+            self.edge_targets = numpy.empty(0, dtype=numpy.int64)
+
+        edge_sources = numpy.repeat(numpy.arange(case_count), edge_counts)
+        self.edge_is_close_in_time = numpy.abs(self.report_days[edge_sources] -
+                                               self.report_days[self.edge_targets]) <= close_in_time
+
+        self._is_member = numpy.zeros(case_count, dtype=bool)
+
+        # Number of edges visited by count_close_pairs(), i.e. pairs of cases checked for cluster membership
+        self.pair_comparisons = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_edge_count(self):
+        return len(self.edge_targets)
+
+    def count_close_pairs(self, case_indices):
+        """
+        Counts the close pairs among a subset of the cases of this graph.
+
+        :param case_indices: indices of the cases in the subset, without duplicates
+        :return: tuple of (close_in_space, close_in_time, close_space_and_time)
+        """
+        case_indices = numpy.asarray(case_indices, dtype=numpy.int64)
+
+        starts = self.edge_offsets[case_indices]
+        lengths = self.edge_offsets[case_indices + 1] - starts
+        edge_total = int(lengths.sum())
+        self.pair_comparisons += edge_total
+
+        close_in_space_count = 0
+        close_space_and_time_count = 0
+        if edge_total:
+            first_positions = numpy.cumsum(lengths) - lengths
+            edge_positions = numpy.arange(edge_total) + numpy.repeat(starts - first_positions, lengths)
+
+            self._is_member[case_indices] = True
+            try:
+                is_internal = self._is_member[self.edge_targets[edge_positions]]
+            finally:
+                self._is_member[case_indices] = False
+
+            close_in_space_count = int(numpy.count_nonzero(is_internal))
+            close_space_and_time_count = int(numpy.count_nonzero(is_internal &
+                                                                  self.edge_is_close_in_time[edge_positions]))
+
+        close_in_time_count = count_close_in_time(self.report_days[case_indices], self.close_in_time,
+                                                  ids=self.ids[case_indices])
+
+        return close_in_space_count, close_in_time_count, close_space_and_time_count
+
+
+def count_close_in_time(report_days, close_in_time, ids=None):
+    """
+    Counts the pairs of report dates that are at most `close_in_time` days apart,
+    using a sorted array instead of comparing all pairs.
+    If ids are given, pairs of cases with the same id are not counted, like in count_close_pairs()
+    """
+    report_days = numpy.asarray(report_days, dtype=numpy.int64)
+    close_in_time_count = count_close_report_days(report_days, close_in_time)
+    if ids is None or len(report_days) < 2:
+        return close_in_time_count
+
+    (id_numbers, id_counts) = numpy.unique(ids, return_inverse=True, return_counts=True)[1:]
+    if id_counts.max() == 1:
+        return close_in_time_count
+
+    # Shifting the report days of every id by more than the time span of all report dates
+    # leaves only the pairs with the same id close in time
+    id_offset = int(report_days.max() - report_days.min()) + close_in_time + 1
+    same_id_days = (report_days - report_days.min()) + id_numbers.astype(numpy.int64) * id_offset
+    return close_in_time_count - count_close_report_days(same_id_days, close_in_time)
+
+
+def count_close_report_days(report_days, close_in_time):
+    report_days = numpy.sort(report_days)
+    last_close_positions = numpy.searchsorted(report_days, report_days + close_in_time, side='right')
+    return int((last_close_positions - numpy.arange(1, len(report_days) + 1)).sum())
+
+
+def use_close_pair_graph(clusters):
+    """
+    Whether counting the close pairs of clusters from one ClosePairGraph is expected to be faster
+    than counting them per cluster with count_close_pairs(): when the clusters are large on average,
+    and contain every case more than once (overlap = total cluster size / number of distinct cases)
+    """
+    if not clusters:
+        return False
+
+    total_case_count = sum(cluster.get_case_count() for cluster in clusters)
+    if total_case_count < MIN_MEAN_CLUSTER_SIZE_FOR_GRAPH * len(clusters):
+        return False
+
+    return total_case_count >= MIN_CLUSTER_OVERLAP_FOR_GRAPH * get_distinct_case_count(clusters)
+
+
+def get_distinct_case_count(clusters):
+    case_tables = set(id(cluster.case_table) for cluster in clusters if cluster.case_indices is not None)
+    if len(case_tables) == 1 and all(cluster.case_indices is not None for cluster in clusters):
+        return len(numpy.unique(numpy.concatenate([cluster.case_indices for cluster in clusters])))
+
+    return len(numpy.unique(numpy.concatenate([cluster.get_case_columns()[0] for cluster in clusters])))
+
+
+def get_close_pair_graph_for_clusters(clusters, close_in_space, close_in_time):
+    """
+    Builds a ClosePairGraph of all distinct cases in a collection of clusters
+
+    :return: tuple of (ClosePairGraph, list with an array of case indices in the graph for every cluster)
+    """
+    case_tables = set(id(cluster.case_table) for cluster in clusters if cluster.case_indices is not None)
+    if len(case_tables) == 1 and all(cluster.case_indices is not None for cluster in clusters):
+        return get_close_pair_graph_for_case_table(clusters, close_in_space, close_in_time)
+
+    case_columns_per_cluster = [cluster.get_case_columns() for cluster in clusters]
+    all_ids = numpy.concatenate([case_columns[0] for case_columns in case_columns_per_cluster])
+    (ids, first_positions, inverse) = numpy.unique(all_ids, return_index=True, return_inverse=True)
+
+    # The graph has every ID once, with the location and report date of its first occurrence
+    x = numpy.concatenate([case_columns[1] for case_columns in case_columns_per_cluster])[first_positions]
+    y = numpy.concatenate([case_columns[2] for case_columns in case_columns_per_cluster])[first_positions]
+    report_days = numpy.concatenate([case_columns[3] for case_columns in case_columns_per_cluster])[first_positions]
+
+    cluster_ends = numpy.cumsum([len(case_columns[0]) for case_columns in case_columns_per_cluster])
+    case_indices_per_cluster = [numpy.unique(case_indices)
+                                for case_indices in numpy.split(inverse, cluster_ends[:-1])]
+
+    close_pair_graph = ClosePairGraph(ids, x, y, report_days, close_in_space, close_in_time)
+    return close_pair_graph, case_indices_per_cluster
+
+
+def get_close_pair_graph_for_case_table(clusters, close_in_space, close_in_time):
+    """
+    Same as get_close_pair_graph_for_clusters(), for clusters that all refer to the same CaseTable
+    """
+    case_table = clusters[0].case_table
+    table_indices = numpy.unique(numpy.concatenate([cluster.case_indices for cluster in clusters]))
+
+    close_pair_graph = ClosePairGraph(case_table.ids[table_indices],
+                                      case_table.x[table_indices],
+                                      case_table.y[table_indices],
+                                      case_table.report_days[table_indices],
+                                      close_in_space,
+                                      close_in_time)
+    case_indices_per_cluster = [numpy.unique(numpy.searchsorted(table_indices, cluster.case_indices))
+                                for cluster in clusters]
+    return close_pair_graph, case_indices_per_cluster
@@ -0,0 +1,115 @@
+import datetime
+import logging
+
+from sqlalchemy import text
+
+
+# Tables that are partitioned by month, with their partition key, see migration b7e2d5c18f34
+PARTITIONED_TABLES = {
+    'cases': 'report_date',
+    'risk': 'risk_date'
+}
+
+
+def ensure_monthly_partitions(session, table_name, startdate, enddate):
+    """
+    Creates the monthly partitions of table_name that cover startdate - enddate, if they
+    do not exist yet. Does not commit: the partitions are created in the transaction of session.
+
+    Rows that were written to the default partition before the partition of their month
+    existed are moved into the new partition.
+    """
+    if not is_partitioned(session, table_name):
+        return
+
+    partition_names = get_partition_names(session, table_name)
+    months = [month for month in get_months(startdate, enddate)
+              if get_partition_name(table_name, month) not in partition_names]
+    if not months:
+        return
+
+    # Risk workers can create the same partitions at the same time. The lock is released at commit.
+    session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:table_name))"), {'table_name': table_name})
+    partition_names = get_partition_names(session, table_name)
+
+    for month in months:
+        partition_name = get_partition_name(table_name, month)
+        if partition_name not in partition_names:
+            create_monthly_partition(session, table_name, partition_name, month)
+
+
+def move_rows_from_default_partition(session, table_name):
+    """
+    Creates the partitions for the rows in the default partition of table_name, which moves those rows
+    into them. Used after inserting rows whose dates are not known beforehand.
+    """
+    if not is_partitioned(session, table_name):
+        return
+
+    (startdate, enddate) = session.execute(text("SELECT min({0}), max({0}) FROM {1}_default"
+                                                .format(PARTITIONED_TABLES[table_name], table_name))).first()
+    if startdate is not None:
+        ensure_monthly_partitions(session, table_name, startdate, enddate)
+
+
+def create_monthly_partition(session, table_name, partition_name, month):
+    partition_key = PARTITIONED_TABLES[table_name]
+    next_month = get_next_month(month)
+    logging.info("Creating partition %s", partition_name)
+
+    session.execute(text("CREATE TABLE {0} (LIKE {1} INCLUDING DEFAULTS)".format(partition_name, table_name)))
+    # The moved rows remain cases: keeps the trigger on cases from removing their IDs from case_ids,
+    # see migration b7e2d5c18f34
+    session.execute(text("SELECT set_config('dycast.moving_partition_rows', 'on', true)"))
+    session.execute(text("""
+        WITH moved_rows AS (
+            DELETE FROM {0}_default
+            WHERE {1} >= :month AND {1} < :next_month
+            RETURNING *
+        )
+        INSERT INTO {2} SELECT * FROM moved_rows
+        """.format(table_name, partition_key, partition_name)),
+        {'month': month, 'next_month': next_month})
+    session.execute(text("SELECT set_config('dycast.moving_partition_rows', 'off', true)"))
+    session.execute(text("ALTER TABLE {0} ATTACH PARTITION {1} FOR VALUES FROM ('{2}') TO ('{3}')"
+                         .format(table_name, partition_name, month.isoformat(), next_month.isoformat())))
+
+
+def is_partitioned(session, table_name):
+    """
+    False if the database was not migrated to partitioned tables yet
+    """
+    relkind = session.execute(text("SELECT relkind FROM pg_class WHERE relname = :table_name"),
+                              {'table_name': table_name}).scalar()
+    return relkind == 'p'
+
+
+def get_partition_names(session, table_name):
+    rows = session.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = :table_name
+        """), {'table_name': table_name})
+    return set(row[0] for row in rows)
+
+
+def get_partition_name(table_name, month):
+    return "{0}_y{1:04d}m{2:02d}".format(table_name, month.year, month.month)
+
+
+def get_months(startdate, enddate):
+    """
+    Yields the first day of every month from the month of startdate up to and including that of enddate
+    """
+    month = startdate.replace(day=1)
+    while month <= enddate:
+        yield month
+        month = get_next_month(month)
+
+
+def get_next_month(month):
+    if month.month == 12:
+        return datetime.date(month.year + 1, 1, 1)
+    return datetime.date(month.year, month.month + 1, 1)
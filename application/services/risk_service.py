@@ -1,97 +1,250 @@
+import collections
+import copy
 import datetime
 import logging
+import multiprocessing
 import time
 
-from sqlalchemy import func, select
-from sqlalchemy.dialects.postgresql import array
+import numpy
+from sqlalchemy import Integer, any_, func
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from sqlalchemy.sql.expression import literal
 
+from models.classes.case_table import CaseTable
 from models.classes.cluster import Cluster
+from models.classes.distribution_margin_table import DistributionMarginTable
+from models.enums import enums
 from models.models import Case, DistributionMargin, Risk
 from services import config_service
 from services import database_service
 from services import geography_service
+from services import grid_pruning_service
+from services import grid_service
+from services import instrumentation_service
 from services import logging_service
+from services import memory_cluster_service as memory_cluster_service_module
+from services import pair_count_service
+from services import partition_service
+from services import risk_writer_service
 
 CONFIG = config_service.get_config()
 
+DailyRiskResult = collections.namedtuple('DailyRiskResult',
+                                         ['risk_date', 'point_count', 'points_above_threshold', 'elapsed_seconds',
+                                          'stages'])
+
 
 class RiskService(object):
 
     def __init__(self, dycast_parameters):
         self.system_srid = CONFIG.get("system_srid")
         self.dycast_parameters = dycast_parameters
+        self.memory_cluster_service = None
+        self.distribution_margin_table = None
+        self.grid_points_query = None
+        self.grid_x = None
+        self.grid_y = None
+        self.cell_ids = None
+        self.tiles = None
+        self.instrumentation = instrumentation_service.Instrumentation()
 
     def generate_risk(self):
-
-        session = database_service.get_sqlalchemy_session()
         logging_service.display_current_parameter_set(self.dycast_parameters)
 
-        case_threshold = self.dycast_parameters.case_threshold
+        date_ranges = get_date_ranges(self.dycast_parameters.startdate,
+                                      self.dycast_parameters.enddate,
+                                      self.dycast_parameters.workers)
 
-        gridpoints = geography_service.generate_grid(self.dycast_parameters)
+        if len(date_ranges) > 1:
+            daily_results = self.generate_risk_in_parallel(date_ranges)
+        else:
+            daily_results = self.generate_risk_for_dates(self.dycast_parameters.startdate,
+                                                         self.dycast_parameters.enddate)
 
-        day = self.dycast_parameters.startdate
-        delta = datetime.timedelta(days=1)
+        stages = [daily_result.stages for daily_result in daily_results]
+        instrumentation_service.log_summary(stages)
+        if self.dycast_parameters.write_stages:
+            instrumentation_service.write_json_lines(stages, logging_service.get_stages_file_path())
 
-        while day <= self.dycast_parameters.enddate:
-            start_time = time.time()
-            logging.info("Starting daily_risk for %s", day)
-            points_above_threshold = 0
+    def generate_risk_in_parallel(self, date_ranges):
+        """
+        Generates risk for every date range in its own worker process, with its own
+        database session. The daily results are logged in date order as the ranges finish.
+        :return: list of DailyRiskResult, one for every day
+        """
+        self.prepare_grid_for_workers()
+        # The workers open connections of their own, they should not inherit those of this process
+        database_service.dispose_engines()
 
-            clusters_per_point_query = self.get_clusters_per_point_query(session, gridpoints, day)
-            clusters_per_point = self.get_clusters_per_point_from_query(clusters_per_point_query)
+        logging.info("Generating risk in %s worker processes", len(date_ranges))
+        worker_arguments = [(self.dycast_parameters, startdate, enddate) for (startdate, enddate) in date_ranges]
 
-            for cluster in clusters_per_point:
-                vector_count = cluster.get_case_count()
-                if vector_count >= case_threshold:
-                    points_above_threshold += 1
-                    self.get_close_space_and_time_for_cluster(cluster)
-                    self.get_cumulative_probability_for_cluster(session, cluster)
+        with multiprocessing.Pool(len(date_ranges),
+                                  initializer=init_worker,
+                                  initargs=(config_service.get_config(),)) as pool:
+            daily_results_per_range = pool.imap(generate_risk_in_worker, worker_arguments)
 
-                    point = geography_service.get_point_from_lat_long(cluster.point.y, cluster.point.x, self.system_srid)
+            all_daily_results = []
+            for (startdate, enddate) in date_ranges:
+                try:
+                    daily_results = next(daily_results_per_range)
+                except Exception:
+                    logging.exception("Could not generate risk for %s - %s", startdate, enddate)
+                    raise
 
-                    risk = Risk(risk_date=day,
-                                number_of_cases=vector_count,
-                                lat=cluster.point.y,
-                                long=cluster.point.x,
-                                location=point,
-                                close_pairs=cluster.close_space_and_time,
-                                close_space=cluster.close_in_space,
-                                close_time=cluster.close_in_time,
-                                cumulative_probability=cluster.cumulative_probability)
+                for daily_result in daily_results:
+                    log_daily_risk_result(daily_result, self.dycast_parameters.case_threshold)
+                all_daily_results.extend(daily_results)
 
-                    self.insert_risk(session, risk)
+        return all_daily_results
 
+    def prepare_grid_for_workers(self):
+        """
+        Stores the grid in the grid cache and in the grid_points table before the workers start,
+        so that they do not all generate and store it at the same time
+        """
+        with database_service.session_scope() as session:
+            grid_x, grid_y = grid_service.get_grid_coordinates(session, self.dycast_parameters)
+            grid_service.init_grid_table(session,
+                                         grid_service.get_grid_key(self.dycast_parameters),
+                                         grid_x,
+                                         grid_y,
+                                         geography_service.get_grid_row_count(self.dycast_parameters))
+
+    def generate_risk_for_dates(self, startdate, enddate, log_progress=True):
+        """
+        :param log_progress: log the result of every day as soon as it is done
+        :return: list of DailyRiskResult, one for every day
+        """
+        with database_service.session_scope() as session:
+            partition_service.ensure_monthly_partitions(session, 'risk', startdate, enddate)
             session.commit()
 
-            logging.info(
-                "Finished daily_risk for %s: done %s points", day, len(gridpoints))
-            logging.info("Total points above threshold of %s: %s",
-                         case_threshold, points_above_threshold)
-            logging.info("Time elapsed: %.0f seconds",
-                         time.time() - start_time)
+            case_threshold = self.dycast_parameters.case_threshold
+            risk_writer = risk_writer_service.RiskWriter(session,
+                                                         batch_size=self.dycast_parameters.risk_batch_size,
+                                                         flush_interval=self.dycast_parameters.risk_flush_interval)
+            daily_results = []
+
+            grid_x, grid_y = grid_service.get_grid_coordinates(session, self.dycast_parameters)
+            self.grid_x, self.grid_y = grid_x, grid_y
+
+            # Risk refers to the gridpoints by the cell IDs of their locations in the grid_cells table
+            grid_key = grid_service.get_grid_key(self.dycast_parameters)
+            grid_service.init_grid_table(session,
+                                         grid_key,
+                                         grid_x,
+                                         grid_y,
+                                         geography_service.get_grid_row_count(self.dycast_parameters))
+            self.cell_ids = grid_service.get_cell_ids(session, grid_key)
+
+            self.distribution_margin_table = self.get_distribution_margin_table(session)
+
+            if self.dycast_parameters.engine == enums.Risk_engine.MEMORY:
+                self.memory_cluster_service = memory_cluster_service_module.MemoryClusterService(self.dycast_parameters,
+                                                                                                 grid_x,
+                                                                                                 grid_y)
+            elif self.dycast_parameters.engine == enums.Risk_engine.INCREMENTAL:
+                self.memory_cluster_service = memory_cluster_service_module.IncrementalClusterService(self.dycast_parameters,
+                                                                                                      grid_x,
+                                                                                                      grid_y)
+            else:
+                self.grid_points_query = grid_service.get_points_query_from_grid_table(grid_key)
+
+            if self.dycast_parameters.tile_size:
+                if self.memory_cluster_service is not None:
+                    logging.warning("Tiles are only used by the sql engine, ignoring tile size")
+                else:
+                    self.tiles = grid_service.get_tiles(grid_x, grid_y, self.dycast_parameters.tile_size)
+                    logging.info("Split grid into %s tiles of %s meter", len(self.tiles), self.dycast_parameters.tile_size)
+
+            day = startdate
+            delta = datetime.timedelta(days=1)
+
+            while day <= enddate:
+                start_time = time.time()
+                if log_progress:
+                    logging.info("Starting daily_risk for %s", day)
+                points_above_threshold = 0
+                rows_written = risk_writer.rows_written
+                self.instrumentation.start_day(day)
+
+                # One tile at a time, so that only the clusters of one tile are in memory
+                for clusters_per_point in self.get_clusters_per_tile(session, day):
+                    points_above_threshold += self.write_risk_for_clusters(session,
+                                                                           risk_writer,
+                                                                           day,
+                                                                           clusters_per_point)
+
+                with self.instrumentation.timer('risk_writes'):
+                    risk_writer.flush_if_due()
+                self.instrumentation.count('rows_written', risk_writer.rows_written - rows_written)
+
+                daily_result = DailyRiskResult(day,
+                                               len(grid_x),
+                                               points_above_threshold,
+                                               time.time() - start_time,
+                                               self.instrumentation.finish_day())
+                daily_results.append(daily_result)
+                if log_progress:
+                    log_daily_risk_result(daily_result, case_threshold)
+
+                day += delta
+
+            risk_writer.close()
+
+        return daily_results
+
+    def write_risk_for_clusters(self, session, risk_writer, day, clusters_per_point):
+        """
+        Scores the clusters that reach the case threshold and adds their risk to risk_writer
+        :return: number of clusters that reach the case threshold
+        """
+        case_threshold = self.dycast_parameters.case_threshold
+        points_above_threshold = 0
 
-            day += delta
+        clusters_above_threshold = [cluster for cluster in clusters_per_point
+                                    if cluster.get_case_count() >= case_threshold]
+        self.instrumentation.count('clusters_above_threshold', len(clusters_above_threshold))
 
-        try:
-            session.commit()
-        except SQLAlchemyError as e:
-            session.rollback()
-            logging.exception("There was a problem committing the risk data session")
-            logging.exception(e)
-            raise
-        finally:
-            session.close()
+        # The clusters of the incremental engine come with their close pair counts
+        with self.instrumentation.timer('close_pairs'):
+            self.enrich_clusters_per_point_with_close_space_and_time(
+                [cluster for cluster in clusters_above_threshold if cluster.close_space_and_time is None])
+
+        with self.instrumentation.timer('probability'):
+            for cluster in clusters_above_threshold:
+                if cluster.cumulative_probability is None:
+                    self.instrumentation.count('probability_cache_misses')
+                    self.get_cumulative_probability_for_cluster(session, cluster)
+                else:
+                    self.instrumentation.count('probability_cache_hits')
+
+        with self.instrumentation.timer('risk_writes'):
+            for cluster in clusters_above_threshold:
+                vector_count = cluster.get_case_count()
+                points_above_threshold += 1
+
+                risk = Risk(risk_date=day,
+                            cell_id=int(self.cell_ids[cluster.point_index]),
+                            number_of_cases=vector_count,
+                            close_pairs=cluster.close_space_and_time,
+                            close_space=cluster.close_in_space,
+                            close_time=cluster.close_in_time,
+                            cumulative_probability=cluster.cumulative_probability)
+
+                risk_writer.add(risk)
+
+        return points_above_threshold
 
     def insert_risk(self, session, risk):
         try:
             session.add(risk)
             session.commit()
         except IntegrityError as e:
-            logging.warning("Risk already exists in database for this date '%s' and location '%s - %s', skipping...",
-                            risk.risk_date, risk.lat, risk.long)
+            logging.warning("Risk already exists in database for this date '%s' and cell '%s', skipping...",
+                            risk.risk_date, risk.cell_id)
             session.rollback()
         except SQLAlchemyError as e:
             logging.exception("There was a problem inserting risk")
@@ -99,101 +252,249 @@ class RiskService(object):
             session.rollback()
             raise
 
+    def get_clusters_per_tile(self, session, riskdate):
+        """
+        Yields the clusters of this day per tile of the grid, see grid_service.get_tiles().
+        Without tiles (or with an in-memory engine) all clusters are yielded at once.
+        """
+        if self.memory_cluster_service is not None or self.tiles is None:
+            yield self.get_clusters_per_point(session, riskdate)
+            return
+
+        case_table = self.get_case_table(session, riskdate)
+
+        candidate_point_indices = None
+        if self.dycast_parameters.grid_pruning:
+            candidate_point_indices = self.get_candidate_point_indices(case_table)
+
+        for tile_point_indices in self.tiles:
+            if candidate_point_indices is not None:
+                tile_point_indices = numpy.intersect1d(tile_point_indices, candidate_point_indices, assume_unique=True)
+            if len(tile_point_indices):
+                yield self.get_clusters_per_point(session, riskdate, tile_point_indices, case_table)
+
+    def get_clusters_per_point(self, session, riskdate, point_indices=None, case_table=None):
+        """
+        :param point_indices: optional, only the gridpoints with these indices are queried (sql engine only)
+        :param case_table: optional, the cases of the temporal window of riskdate, see get_case_table()
+        """
+        if self.memory_cluster_service is not None:
+            with self.instrumentation.timer('cluster_discovery'):
+                return self.memory_cluster_service.get_clusters_per_point(session, riskdate)
+
+        if case_table is None:
+            case_table = self.get_case_table(session, riskdate)
+
+        if point_indices is None and self.dycast_parameters.grid_pruning:
+            point_indices = self.get_candidate_point_indices(case_table)
+
+        if point_indices is not None and not len(point_indices):
+            return []
+
+        clusters_per_point_query = self.get_clusters_per_point_query_for_points(session,
+                                                                                self.grid_points_query,
+                                                                                riskdate,
+                                                                                point_indices)
+        return self.get_clusters_per_point_from_query(clusters_per_point_query, case_table)
+
+    def get_case_table(self, session, riskdate):
+        """
+        Returns the cases of the temporal window of riskdate as a CaseTable
+        """
+        days_prev = self.dycast_parameters.temporal_domain
+        enddate = riskdate
+        startdate = riskdate - datetime.timedelta(days=(days_prev))
+
+        with self.instrumentation.timer('case_query'):
+            rows = self.get_case_table_query(session) \
+                .filter(Case.report_date >= startdate,
+                        Case.report_date <= enddate) \
+                .all()
+            case_table = CaseTable.from_rows(rows)
+
+        self.instrumentation.count('cases_in_window', len(case_table))
+        return case_table
+
+    def get_case_table_for_ids(self, session, case_ids):
+        if not case_ids:
+            return CaseTable()
+
+        rows = self.get_case_table_query(session) \
+            .filter(Case.id == any_(literal(sorted(case_ids), ARRAY(Integer)))) \
+            .all()
+        return CaseTable.from_rows(rows)
+
+    def get_case_table_query(self, session):
+        return session.query(Case.id,
+                             Case.report_date,
+                             func.ST_X(Case.location),
+                             func.ST_Y(Case.location))
+
+    def get_candidate_point_indices(self, case_table):
+        """
+        Returns the indices of the gridpoints that can reach the case threshold on this day,
+        based on the locations of the cases in its temporal window
+        """
+        with self.instrumentation.timer('grid_pruning'):
+            point_indices = grid_pruning_service.get_candidate_point_indices(self.grid_x,
+                                                                             self.grid_y,
+                                                                             case_table.x,
+                                                                             case_table.y,
+                                                                             self.dycast_parameters.spatial_domain,
+                                                                             self.dycast_parameters.case_threshold)
+        self.instrumentation.count('candidate_points', len(point_indices))
+
+        logging.info("Grid pruning: %s of %s gridpoints can reach the case threshold",
+                     len(point_indices), len(self.grid_x))
+        return point_indices
+
     def get_clusters_per_point_query(self, session, gridpoints, riskdate):
+        points_query = self.get_points_query_from_gridpoints(session, gridpoints)
+        return self.get_clusters_per_point_query_for_points(session, points_query, riskdate)
+
+    def get_clusters_per_point_query_for_points(self, session, points_query, riskdate, point_indices=None):
+        """
+        :param points_query: query with the gridpoints in a 'point' column and their index
+            in a 'point_index' column, see grid_service
+        :param point_indices: optional, only the gridpoints with these indices are queried
+        """
+        point_column = points_query.c.point
         days_prev = self.dycast_parameters.temporal_domain
         enddate = riskdate
         startdate = riskdate - datetime.timedelta(days=(days_prev))
 
-        points_query = self.get_points_query_from_gridpoints(gridpoints)
-
-        return session.query(func.array_agg(
-            func.json_build_object(
-                "case_id",
-                Case.id,
-                "report_date",
-                Case.report_date,
-                "location",
-                func.ST_AsText(Case.location)
-            )).label('case_array'),
-                             points_query.c.point.geom.label('point')) \
+        clusters_per_point_query = session.query(func.array_agg(Case.id).label('case_ids'),
+                                                 points_query.c.point_index.label('point_index'),
+                                                 point_column.label('point')) \
             .join(points_query, literal(True)) \
             .filter(Case.report_date >= startdate,
                     Case.report_date <= enddate,
                     func.ST_DWithin(Case.location,
-                                    points_query.c.point.geom,
+                                    point_column,
                                     self.dycast_parameters.spatial_domain)) \
-            .group_by(points_query.c.point.geom)
+            .group_by(points_query.c.point_index, point_column)
+
+        if point_indices is not None:
+            selected_points_table = grid_service.init_selected_points_table(session, point_indices)
+            clusters_per_point_query = clusters_per_point_query.join(
+                selected_points_table,
+                selected_points_table.c.point_index == points_query.c.point_index)
 
-    def get_clusters_per_point_from_query(self, cluster_per_point_query):
+        return clusters_per_point_query
+
+    def get_clusters_per_point_from_query(self, cluster_per_point_query, case_table=None):
         """
-        Because get_clusters_per_point_query() aggregates cases by point in a json format,
-        here we create a proper collection of classes with it, in order to speed up further
-        iterations over these clusters
+        Because get_clusters_per_point_query() only aggregates the IDs of the cases by point,
+        the clusters refer to the cases by their index in case_table (or in a table fetched once
+        for all IDs in the result), so that a case in many clusters is only transferred and stored once
         :param cluster_per_point_query:
+        :param case_table: optional, CaseTable with at least the cases of the query result
         :return: array of Cluster objects
         """
-        rows = cluster_per_point_query.all()
+        with self.instrumentation.timer('cluster_query'):
+            rows = cluster_per_point_query.all()
+        self.instrumentation.count('rows_fetched', len(rows))
         clusters_per_point = []
 
+        if case_table is None:
+            case_ids = set(case_id for row in rows for case_id in row.case_ids)
+            case_table = self.get_case_table_for_ids(cluster_per_point_query.session, case_ids)
+
         for row in rows:
             cluster = Cluster()
             cluster.point = geography_service.get_shape_from_sqlalch_element(row.point)
-            cluster.cases = []
-
-            for case_json in row.case_array:
-                case = Case()
-
-                case.id = case_json['case_id']
-                case.report_date = datetime.datetime.strptime(case_json['report_date'], "%Y-%m-%d").date()
-                case.location = geography_service.get_shape_from_literal_wkt(case_json['location'])
-
-                cluster.cases.append(case)
-
+            cluster.point_index = row.point_index
+            cluster.case_table = case_table
+            cluster.case_indices = case_table.get_indices(row.case_ids)
             cluster.case_count = cluster.get_case_count()
 
             clusters_per_point.append(cluster)
 
         return clusters_per_point
 
-    def get_points_query_from_gridpoints(self, gridpoints):
-        return select([
-            func.ST_DumpPoints(
-                func.ST_Collect(array(gridpoints)))
-                .label('point')]) \
-            .alias('point_query')
+    def get_points_query_from_gridpoints(self, session, gridpoints):
+        """
+        Stores the gridpoints in a temporary table, so that they are not sent along with every query.
+        The table is dropped when the transaction of session ends, so the query must run before it commits
+        """
+        points = [geography_service.get_shape_from_sqlalch_element(gridpoint) for gridpoint in gridpoints]
+        return grid_service.init_temporary_grid_table(session,
+                                                      [point.x for point in points],
+                                                      [point.y for point in points])
 
     def enrich_clusters_per_point_with_close_space_and_time(self, clusters_per_point):
-        for cluster in clusters_per_point:
-            self.get_close_space_and_time_for_cluster(cluster)
+        """
+        Counts the close pairs of all clusters from one shared graph of close case pairs,
+        so that the pairs shared by overlapping clusters are only compared once.
+        Small or barely overlapping clusters are counted one by one instead,
+        see pair_count_service.use_close_pair_graph()
+        """
+        if not clusters_per_point:
+            return
 
-    def get_close_space_and_time_for_cluster(self, cluster):
+        if not pair_count_service.use_close_pair_graph(clusters_per_point):
+            for cluster in clusters_per_point:
+                self.get_close_space_and_time_for_cluster(cluster)
+            return
+
+        self.enrich_clusters_per_point_with_close_space_and_time_from_graph(clusters_per_point)
+
+    def enrich_clusters_per_point_with_close_space_and_time_from_graph(self, clusters_per_point):
+        close_pair_graph, case_indices_per_cluster = pair_count_service.get_close_pair_graph_for_clusters(
+            clusters_per_point,
+            self.dycast_parameters.close_in_space,
+            self.dycast_parameters.close_in_time)
 
-        cluster.close_in_space = 0
-        cluster.close_in_time = 0
-        cluster.close_space_and_time = 0
-
-        for case in cluster.cases:
-            for nearby_case in cluster.cases:
-                if case.id > nearby_case.id:
-                    is_close_in_time = False
-                    is_close_in_space = False
-                    if geography_service.is_within_distance(case.location,
-                                                            nearby_case.location,
-                                                            self.dycast_parameters.close_in_space):
-                        is_close_in_space = True
-                        cluster.close_in_space += 1
-                    if abs((case.report_date - nearby_case.report_date).days) <= self.dycast_parameters.close_in_time:
-                        is_close_in_time = True
-                        cluster.close_in_time += 1
-                    if is_close_in_space & is_close_in_time:
-                        cluster.close_space_and_time += 1
+        for cluster, case_indices in zip(clusters_per_point, case_indices_per_cluster):
+            (cluster.close_in_space,
+             cluster.close_in_time,
+             cluster.close_space_and_time) = close_pair_graph.count_close_pairs(case_indices)
+
+        self.instrumentation.count('close_pair_edges', close_pair_graph.get_edge_count())
+        self.instrumentation.count('pair_comparisons', close_pair_graph.pair_comparisons)
+
+    def get_close_space_and_time_for_cluster(self, cluster):
+        (ids, x, y, report_days) = cluster.get_case_columns()
+
+        (cluster.close_in_space,
+         cluster.close_in_time,
+         cluster.close_space_and_time) = pair_count_service.count_close_pairs(
+            ids,
+            x,
+            y,
+            report_days,
+            self.dycast_parameters.close_in_space,
+            self.dycast_parameters.close_in_time)
 
     # Probability
     def enrich_clusters_per_point_with_cumulative_probability(self, session, clusters_per_point):
         for cluster in clusters_per_point:
             self.get_cumulative_probability_for_cluster(session, cluster)
 
+    def get_distribution_margin_table(self, session):
+        rows = session.query(DistributionMargin.number_of_cases,
+                             DistributionMargin.close_in_space_and_time,
+                             DistributionMargin.close_time,
+                             DistributionMargin.close_space,
+                             DistributionMargin.cumulative_probability) \
+            .yield_per(10000)
+
+        distribution_margin_table = DistributionMarginTable.from_rows(rows)
+
+        logging.info("Loaded %s distribution margins into memory: %.1f MB",
+                     len(distribution_margin_table),
+                     distribution_margin_table.get_memory_footprint() / 1024.0 / 1024.0)
+        return distribution_margin_table
+
     def get_cumulative_probability_for_cluster(self, session, cluster):
+        if self.distribution_margin_table is not None:
+            cluster.cumulative_probability = self.distribution_margin_table.get_cumulative_probability(
+                cluster.case_count,
+                cluster.close_space_and_time,
+                cluster.close_in_space,
+                cluster.close_in_time)
+            return
+
         exact_match = self.get_exact_match_cumulative_probability(session, cluster)
 
         if exact_match:
@@ -242,3 +543,52 @@ class RiskService(object):
             .order_by(func.abs(DistributionMargin.close_time - cluster.close_in_time)) \
             .limit(1) \
             .as_scalar()
+
+
+def log_daily_risk_result(daily_result, case_threshold):
+    logging.info(
+        "Finished daily_risk for %s: done %s points", daily_result.risk_date, daily_result.point_count)
+    logging.info("Total points above threshold of %s: %s",
+                 case_threshold, daily_result.points_above_threshold)
+    logging.info("Time elapsed: %.0f seconds",
+                 daily_result.elapsed_seconds)
+
+
+def get_date_ranges(startdate, enddate, count):
+    """
+    Splits [startdate, enddate] into at most `count` contiguous date ranges of (nearly) equal length
+    """
+    day_count = (enddate - startdate).days + 1
+    if day_count <= 0:
+        return []
+
+    range_count = max(min(int(count or 1), day_count), 1)
+    (range_length, remainder) = divmod(day_count, range_count)
+
+    date_ranges = []
+    range_startdate = startdate
+    for range_number in range(range_count):
+        length = range_length + (1 if range_number < remainder else 0)
+        range_enddate = range_startdate + datetime.timedelta(days=length - 1)
+        date_ranges.append((range_startdate, range_enddate))
+        range_startdate = range_enddate + datetime.timedelta(days=1)
+
+    return date_ranges
+
+
+# Worker processes
+
+def init_worker(config):
+    config_service.init_config(config)
+    logging_service.init_logging()
+
+
+def generate_risk_in_worker(arguments):
+    (dycast_parameters, startdate, enddate) = arguments
+
+    dycast_parameters = copy.copy(dycast_parameters)
+    dycast_parameters.startdate = startdate
+    dycast_parameters.enddate = enddate
+    dycast_parameters.workers = 1
+
+    return RiskService(dycast_parameters).generate_risk_for_dates(startdate, enddate, log_progress=False)
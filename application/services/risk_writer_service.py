@@ -0,0 +1,93 @@
+import collections
+import logging
+import time
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from models.models import Risk
+
+
+RISK_COLUMNS = ['risk_date',
+                'cell_id',
+                'number_of_cases',
+                'close_pairs',
+                'close_space',
+                'close_time',
+                'cumulative_probability']
+
+
+class RiskWriter(object):
+    """
+    Buffers Risk rows and writes them with one multi-row
+    INSERT ... ON CONFLICT DO NOTHING per batch, instead of one transaction per row.
+    Rows that already exist in the database are skipped with a warning, like
+    RiskService.insert_risk() does.
+
+    Arguments:
+        session {Session} -- SQLAlchemy session to write with
+        batch_size {int} -- number of rows after which the buffer is flushed
+        flush_interval {float} -- seconds after which the buffer is flushed, regardless of its size (0: never)
+    """
+
+    def __init__(self, session, batch_size=1000, flush_interval=0):
+        self.session = session
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.rows_written = 0
+        self.rows_skipped = 0
+
+        self._buffer = []
+        self._last_flush_time = time.time()
+
+    def add(self, risk):
+        self._buffer.append(risk)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        if self.flush_interval and time.time() - self._last_flush_time >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._last_flush_time = time.time()
+        if not self._buffer:
+            return
+
+        buffer = self._buffer
+        self._buffer = []
+
+        statement = insert(Risk.__table__) \
+            .values([get_values_from_risk(risk) for risk in buffer]) \
+            .on_conflict_do_nothing() \
+            .returning(Risk.risk_date, Risk.cell_id)
+
+        try:
+            inserted_keys = collections.Counter(tuple(row) for row in self.session.execute(statement))
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logging.exception("There was a problem inserting risk")
+            logging.exception(e)
+            self.session.rollback()
+            raise
+
+        for risk in buffer:
+            key = (risk.risk_date, risk.cell_id)
+            if inserted_keys[key] > 0:
+                inserted_keys[key] -= 1
+                self.rows_written += 1
+            else:
+                logging.warning("Risk already exists in database for this date '%s' and cell '%s', skipping...",
+                                risk.risk_date, risk.cell_id)
+                self.rows_skipped += 1
+
+    def close(self):
+        self.flush()
+        logging.info("Risk rows written: %s, duplicates skipped: %s", self.rows_written, self.rows_skipped)
+
+
+def get_values_from_risk(risk):
+    return {column: getattr(risk, column) for column in RISK_COLUMNS}
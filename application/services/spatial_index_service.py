@@ -0,0 +1,104 @@
+import math
+
+import numpy
+
+
+class BucketIndex(object):
+    """
+    Uniform-bucket spatial index over a set of points.
+
+    Points are assigned to square buckets of size `cell_size` and sorted by bucket key,
+    so that the points of one row of buckets form a contiguous slice that can be
+    found with a binary search.
+
+    Arguments:
+        x {array} -- x coordinates of the indexed points
+        y {array} -- y coordinates of the indexed points
+        cell_size {float} -- bucket size, ideally in the order of the query radius
+    """
+
+    def __init__(self, x, y, cell_size):
+        self.x = numpy.asarray(x, dtype=numpy.float64)
+        self.y = numpy.asarray(y, dtype=numpy.float64)
+        self.cell_size = float(cell_size)
+
+        if self.cell_size <= 0:
+            raise ValueError("Cell size of bucket index must be positive")
+
+        if len(self.x):
+            self.origin_x = self.x.min()
+            self.origin_y = self.y.min()
+        else:
+            self.origin_x = 0.0
+            self.origin_y = 0.0
+
+        column = self._get_bucket_column(self.x)
+        row = self._get_bucket_row(self.y)
+
+        self.column_count = int(column.max()) + 1 if len(column) else 0
+        self.row_count = int(row.max()) + 1 if len(row) else 0
+
+        keys = row * self.column_count + column
+        self._order = numpy.argsort(keys, kind='mergesort')
+        self._sorted_keys = keys[self._order]
+
+    def __len__(self):
+        return len(self.x)
+
+    def query_radius(self, x, y, radius, strict=False):
+        """
+        Returns the indices (ascending) of all points within `radius` of (x, y).
+        Uses `<=` like PostGIS ST_DWithin, or `<` when `strict` is set.
+        """
+        candidates = self._get_candidates(x, y, radius)
+        if not len(candidates):
+            return candidates
+
+        distance = get_distance(self.x[candidates], self.y[candidates], x, y)
+        if strict:
+            within = distance < radius
+        else:
+            within = distance <= radius
+
+        return numpy.sort(candidates[within])
+
+    def _get_candidates(self, x, y, radius):
+        if not len(self.x):
+            return numpy.empty(0, dtype=numpy.int64)
+
+        column_min = max(int(math.floor((x - radius - self.origin_x) / self.cell_size)), 0)
+        column_max = min(int(math.floor((x + radius - self.origin_x) / self.cell_size)), self.column_count - 1)
+        row_min = max(int(math.floor((y - radius - self.origin_y) / self.cell_size)), 0)
+        row_max = min(int(math.floor((y + radius - self.origin_y) / self.cell_size)), self.row_count - 1)
+
+        if column_min > column_max or row_min > row_max:
+            return numpy.empty(0, dtype=numpy.int64)
+
+        slices = []
+        for row in range(row_min, row_max + 1):
+            first_key = row * self.column_count + column_min
+            last_key = row * self.column_count + column_max
+            start = numpy.searchsorted(self._sorted_keys, first_key, side='left')
+            end = numpy.searchsorted(self._sorted_keys, last_key, side='right')
+            if end > start:
+                slices.append(self._order[start:end])
+
+        if not slices:
+            return numpy.empty(0, dtype=numpy.int64)
+        return numpy.concatenate(slices)
+
+    def _get_bucket_column(self, x):
+        return numpy.floor((x - self.origin_x) / self.cell_size).astype(numpy.int64)
+
+    def _get_bucket_row(self, y):
+        return numpy.floor((y - self.origin_y) / self.cell_size).astype(numpy.int64)
+
+
+def get_distance(x_1, y_1, x_2, y_2):
+    """
+    Planar distance, computed the same way as GEOS and PostGIS do for two points
+    (sqrt(dx * dx + dy * dy)), so that threshold comparisons give identical results
+    """
+    delta_x = x_1 - x_2
+    delta_y = y_1 - y_2
+    return numpy.sqrt(delta_x * delta_x + delta_y * delta_y)
@@ -102,8 +102,7 @@ class ComparativeTestService(object):
 
     # Probability
     def enrich_clusters_with_distribution_margins(self, session, clusters_per_point):
-        for cluster in clusters_per_point:
-            self.get_cumulative_probability_for_cluster(session, cluster)
+        return [self.get_cumulative_probability_for_cluster(session, cluster) for cluster in clusters_per_point]
 
     def get_cumulative_probability_for_cluster(self, session, cluster):
 
@@ -137,13 +136,14 @@ class ComparativeTestService(object):
                                probability_by_nearest_close_time_subquery.label('by_nearest_close_time')) \
             .first()
 
+        # Cluster has __slots__, so the old probability is returned instead of set on the cluster
         if result.exact_match is not None:
-            cluster.old_cumulative_probability = result.exact_match
+            return result.exact_match
         else:
             if result.nearest_close_time is None:
-                cluster.old_cumulative_probability = 0.0001
+                return 0.0001
             else:
                 if result.by_nearest_close_time is None:
-                    cluster.old_cumulative_probability = 0.001
+                    return 0.001
                 else:
-                    cluster.old_cumulative_probability = result.by_nearest_close_time
+                    return result.by_nearest_close_time
@@ -0,0 +1,42 @@
+import unittest
+
+from models.models import Case
+from services import config_service
+from services import database_service
+from tests import test_helper_functions
+
+
+test_helper_functions.init_test_environment()
+
+
+class TestDatabaseServiceFunctions(unittest.TestCase):
+
+    def test_get_engine_is_shared(self):
+        engine = database_service.get_engine()
+        self.assertIs(database_service.get_engine(), engine)
+        self.assertIs(database_service.get_sqlalchemy_session().get_bind(), engine)
+
+    def test_dispose_engines(self):
+        engine = database_service.get_engine()
+        database_service.dispose_engines()
+        self.assertIsNot(database_service.get_engine(), engine)
+
+    def test_get_engine_without_pool_pre_ping(self):
+        config = config_service.get_config()
+        database_service.dispose_engines()
+        config['no_db_pool_pre_ping'] = True
+        try:
+            self.assertFalse(database_service.get_engine().pool._pre_ping)
+        finally:
+            config['no_db_pool_pre_ping'] = False
+            database_service.dispose_engines()
+
+        self.assertTrue(database_service.get_engine().pool._pre_ping)
+
+    def test_session_scope_rolls_back_on_exception(self):
+        with self.assertRaises(ValueError):
+            with database_service.session_scope() as session:
+                session.add(Case(id=1))
+                raise ValueError()
+
+        self.assertEqual(len(session.new), 0)
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 from services import file_service
@@ -19,3 +22,122 @@ class TestFileServiceFunctions(unittest.TestCase):
         body = "This is a test file.\nThis file will be saved to disk."
         file_service.save_file(body, file_name)
         test_helper_functions.delete_test_file()
+
+    def test_save_lines(self):
+        directory = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(directory, "export", "risk.tsv")
+            lines = ["header\n", "first\n", "second\n"]
+
+            line_count = file_service.save_lines(iter(lines), file_path)
+
+            self.assertEqual(line_count, 3)
+            with open(file_path) as saved_file:
+                self.assertEqual(saved_file.read(), "".join(lines))
+            self.assertEqual(os.listdir(os.path.dirname(file_path)), ["risk.tsv"])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_save_lines_failure_keeps_existing_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(directory, "risk.tsv")
+            file_service.save_lines(["earlier export\n"], file_path)
+
+            def get_failing_lines():
+                yield "header\n"
+                raise ValueError("Export failed")
+
+            with self.assertRaises(ValueError):
+                file_service.save_lines(get_failing_lines(), file_path)
+
+            with open(file_path) as saved_file:
+                self.assertEqual(saved_file.read(), "earlier export\n")
+            self.assertEqual(os.listdir(directory), ["risk.tsv"])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_s3_file_writer_parts(self):
+        s3_client = StubS3Client()
+        lines = ["line {0}\n".format(number) for number in range(10)]
+
+        with get_s3_file_writer(s3_client, part_size=20) as output_file:
+            for line in lines:
+                output_file.write(line)
+
+        part_sizes = [len(part['Body']) for part in s3_client.parts]
+        self.assertTrue(all(part_size >= 20 for part_size in part_sizes[:-1]))
+        self.assertEqual(b"".join(part['Body'] for part in s3_client.parts), "".join(lines).encode("utf-8"))
+        self.assertEqual([part['PartNumber'] for part in s3_client.parts], list(range(1, len(part_sizes) + 1)))
+        self.assertEqual(len(s3_client.completed_uploads), 1)
+        self.assertEqual(s3_client.aborted_uploads, [])
+
+    def test_s3_file_writer_single_upload(self):
+        s3_client = StubS3Client()
+
+        with get_s3_file_writer(s3_client, part_size=20) as output_file:
+            output_file.write("header\n")
+
+        self.assertEqual(s3_client.objects, {"dycast/risk.tsv": b"header\n"})
+        self.assertEqual(s3_client.parts, [])
+
+    def test_s3_file_writer_abort(self):
+        s3_client = StubS3Client()
+
+        with self.assertRaises(ValueError):
+            with get_s3_file_writer(s3_client, part_size=20) as output_file:
+                output_file.write("more than one part of content\n")
+                raise ValueError("Export failed")
+
+        self.assertEqual(s3_client.aborted_uploads, ["upload-1"])
+        self.assertEqual(s3_client.completed_uploads, [])
+
+    def test_s3_file_writer_abort_on_failed_completion(self):
+        s3_client = StubS3Client(fail_completion=True)
+
+        with self.assertRaises(IOError):
+            with get_s3_file_writer(s3_client, part_size=20) as output_file:
+                output_file.write("more than one part of content\n")
+
+        self.assertEqual(s3_client.aborted_uploads, ["upload-1"])
+
+
+def get_s3_file_writer(s3_client, part_size):
+    s3_uri = file_service.get_file_uri("s3://test-bucket/dycast/risk.tsv")
+    return file_service.S3FileWriter(s3_uri, s3_client=s3_client, part_size=part_size)
+
+
+class StubS3Client(object):
+    """
+    Records the calls that S3FileWriter makes to an S3 client
+    """
+
+    def __init__(self, fail_completion=False):
+        self.fail_completion = fail_completion
+        self.objects = {}
+        self.parts = []
+        self.completed_uploads = []
+        self.aborted_uploads = []
+        self._upload_count = 0
+
+    def put_object(self, Body, Bucket, Key):
+        self.objects[Key] = Body
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key):
+        self._upload_count += 1
+        return {'UploadId': "upload-{0}".format(self._upload_count)}
+
+    def upload_part(self, Body, Bucket, Key, PartNumber, UploadId):
+        self.parts.append({'Body': Body, 'PartNumber': PartNumber, 'UploadId': UploadId})
+        return {'ETag': "etag-{0}".format(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        if self.fail_completion:
+            raise IOError("Connection lost")
+        self.completed_uploads.append(UploadId)
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted_uploads.append(UploadId)
+        return {}
@@ -0,0 +1,43 @@
+import random
+import unittest
+
+import numpy
+
+from services import grid_pruning_service
+from services.spatial_index_service import get_distance
+
+
+class TestGridPruningServiceFunctions(unittest.TestCase):
+
+    def test_get_candidate_point_indices(self):
+        randomizer = random.Random(42)
+        grid_x, grid_y = numpy.meshgrid(numpy.arange(1820000, 1825000, 100.0),
+                                        numpy.arange(2120000, 2124000, 100.0),
+                                        indexing='ij')
+        grid_x = grid_x.ravel()
+        grid_y = grid_y.ravel()
+
+        case_x = [randomizer.gauss(1822500, 500) for _ in range(60)]
+        case_y = [randomizer.gauss(2122000, 500) for _ in range(60)]
+        # Cases exactly at the spatial domain distance of a gridpoint
+        case_x[:5] = [grid_x[500] + 600] * 5
+        case_y[:5] = [grid_y[500]] * 5
+
+        for case_threshold in (0, 1, 5, 10):
+            candidates = set(grid_pruning_service.get_candidate_point_indices(grid_x,
+                                                                              grid_y,
+                                                                              case_x,
+                                                                              case_y,
+                                                                              600,
+                                                                              case_threshold))
+            self.assertLess(len(candidates), len(grid_x))
+
+            for point_index in range(len(grid_x)):
+                case_count = (get_distance(numpy.array(case_x), numpy.array(case_y),
+                                           grid_x[point_index], grid_y[point_index]) <= 600).sum()
+                if case_count >= max(case_threshold, 1):
+                    self.assertIn(point_index, candidates)
+
+    def test_get_candidate_point_indices_without_cases(self):
+        result = grid_pruning_service.get_candidate_point_indices([0.0, 100.0], [0.0, 0.0], [], [], 600, 1)
+        self.assertEqual(len(result), 0)
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from services import database_service
+from services import geography_service
+from services import grid_service
+from tests import test_helper_functions
+
+
+test_helper_functions.init_test_environment()
+
+
+class TestGridServiceFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.grid_cache_directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.grid_cache_directory)
+
+    def test_get_grid_coordinates_from_cache(self):
+        dycast_parameters = test_helper_functions.get_dycast_parameters()
+        dycast_parameters.grid_cache_directory = self.grid_cache_directory
+
+        session = database_service.get_sqlalchemy_session()
+        try:
+            # The cached grid is only used once the grid is stored in the grid_points table
+            test_helper_functions.get_test_cell_ids(session, dycast_parameters)
+
+            grid_x, grid_y = grid_service.get_grid_coordinates(session, dycast_parameters)
+            cache_file_path = os.path.join(self.grid_cache_directory,
+                                           "grid_{0}.npy".format(grid_service.get_grid_key(dycast_parameters)))
+            self.assertTrue(os.path.exists(cache_file_path))
+
+            cached_grid_x, cached_grid_y = grid_service.get_grid_coordinates(session, dycast_parameters)
+        finally:
+            session.close()
+
+        expected_grid_x, expected_grid_y = geography_service.generate_grid_coordinates(dycast_parameters)
+
+        numpy.testing.assert_array_equal(grid_x, expected_grid_x)
+        self.assertIsInstance(cached_grid_x, numpy.memmap)
+        numpy.testing.assert_array_equal(cached_grid_x, expected_grid_x)
+        numpy.testing.assert_array_equal(cached_grid_y, expected_grid_y)
+
+    def test_get_grid_coordinates_from_cache_not_matching(self):
+        dycast_parameters = test_helper_functions.get_dycast_parameters()
+        dycast_parameters.grid_cache_directory = self.grid_cache_directory
+        expected_grid_x, expected_grid_y = geography_service.generate_grid_coordinates(dycast_parameters)
+
+        # A cached grid with one gridpoint less than the grid
+        cache_file_path = os.path.join(self.grid_cache_directory,
+                                       "grid_{0}.npy".format(grid_service.get_grid_key(dycast_parameters)))
+        grid_service.save_grid_coordinates(expected_grid_x[:-1], expected_grid_y[:-1], cache_file_path)
+
+        session = database_service.get_sqlalchemy_session()
+        try:
+            test_helper_functions.get_test_cell_ids(session, dycast_parameters)
+            grid_x, grid_y = grid_service.get_grid_coordinates(session, dycast_parameters)
+        finally:
+            session.close()
+
+        numpy.testing.assert_array_equal(grid_x, expected_grid_x)
+        numpy.testing.assert_array_equal(grid_y, expected_grid_y)
+        self.assertEqual(len(numpy.load(cache_file_path)), len(expected_grid_x))
+
+    def test_get_grid_key(self):
+        dycast_parameters = test_helper_functions.get_dycast_parameters()
+        grid_key = grid_service.get_grid_key(dycast_parameters)
+
+        dycast_parameters.grid_step = 50
+        self.assertNotEqual(grid_service.get_grid_key(dycast_parameters), grid_key)
+
+    def test_get_cell_ids_shared_between_grids(self):
+        dycast_parameters = test_helper_functions.get_dycast_parameters()
+        # A wider extent with the same origin: the grid has all gridpoints of the first grid, and more
+        wider_dycast_parameters = test_helper_functions.get_dycast_parameters()
+        wider_dycast_parameters.extent_max_x += 500
+
+        session = database_service.get_sqlalchemy_session()
+        try:
+            cell_ids = test_helper_functions.get_test_cell_ids(session, dycast_parameters)
+            wider_cell_ids = test_helper_functions.get_test_cell_ids(session, wider_dycast_parameters)
+        finally:
+            session.close()
+
+        self.assertGreater(len(wider_cell_ids), len(cell_ids))
+        self.assertEqual(len(numpy.unique(wider_cell_ids)), len(wider_cell_ids))
+        numpy.testing.assert_array_equal(wider_cell_ids[:len(cell_ids)], cell_ids)
+
+    def test_get_tiles(self):
+        dycast_parameters = test_helper_functions.get_dycast_parameters(large_dataset=True)
+        grid_x, grid_y = geography_service.generate_grid_coordinates(dycast_parameters)
+
+        tiles = grid_service.get_tiles(grid_x, grid_y, 2000)
+
+        self.assertGreater(len(tiles), 1)
+        numpy.testing.assert_array_equal(numpy.sort(numpy.concatenate(tiles)), numpy.arange(len(grid_x)))
@@ -1,9 +1,11 @@
+import datetime
 import unittest
 
-from sqlalchemy.exc import DataError
+from sqlalchemy.exc import DataError, IntegrityError
 
 from services import import_service as import_service_module
 from services import database_service
+from services import geography_service
 from tests import test_helper_functions
 
 from models.models import Case
@@ -24,6 +26,80 @@ class TestImportServiceFunctions(unittest.TestCase):
         import_service.load_case_files(dycast_model)
 
 
+    def test_load_case_file_bulk(self):
+        import_service = import_service_module.ImportService()
+
+        dycast_model = dycast_parameters.DycastParameters()
+
+        dycast_model.srid_of_cases = '3857'
+        dycast_model.bulk_import = True
+        dycast_model.files_to_import = test_helper_functions.get_test_cases_import_files_latlong()
+
+        file_path = dycast_model.files_to_import[0]
+        (lines_read, lines_processed, lines_loaded, lines_skipped) = import_service.load_case_file_bulk(dycast_model,
+                                                                                                       file_path)
+
+        self.assertGreater(lines_read, 0)
+        self.assertEqual(lines_processed, lines_read)
+        self.assertEqual(lines_loaded + lines_skipped, lines_processed)
+
+        # Loading the same file again only finds duplicates
+        (lines_read, lines_processed, lines_loaded, lines_skipped) = import_service.load_case_file_bulk(dycast_model,
+                                                                                                       file_path)
+        self.assertEqual(lines_loaded, 0)
+        self.assertEqual(lines_skipped, lines_read)
+
+
+    def test_load_case_file_duplicates(self):
+        session = database_service.get_sqlalchemy_session()
+        import_service = import_service_module.ImportService()
+
+        dycast_model = dycast_parameters.DycastParameters()
+        dycast_model.srid_of_cases = 3857
+
+        session.query(Case).filter(Case.id.in_([99997, 99998])).delete(synchronize_session=False)
+        session.commit()
+
+        file_path = test_helper_functions.get_test_file_path()
+        with open(file_path, 'w') as test_file:
+            test_file.write("bird_id\treport_date\tlong\tlat\n")
+            test_file.write("99997\t03/09/16\t1832445.278\t2118527.399\n")
+            test_file.write("99998\t03/09/16\t1832445.278\t2118527.399\n")
+            test_file.write("99997\t03/10/16\t1832445.278\t2118527.399\n")
+
+        try:
+            result = import_service.load_case_file(dycast_model, file_path)
+            self.assertEqual(result, (3, 3, 2, 1))
+
+            result = import_service.load_case_file(dycast_model, file_path)
+            self.assertEqual(result, (3, 3, 0, 3))
+        finally:
+            test_helper_functions.delete_test_file()
+            session.query(Case).filter(Case.id.in_([99997, 99998])).delete(synchronize_session=False)
+            session.commit()
+
+
+    def test_duplicate_case_id_rejected(self):
+        session = database_service.get_sqlalchemy_session()
+        session.query(Case).filter(Case.id == 99996).delete(synchronize_session=False)
+        session.commit()
+
+        location = geography_service.get_point_from_lat_long(2118527.399, 1832445.278, 3857)
+        try:
+            session.add(Case(id=99996, report_date=datetime.date(2016, 3, 9), location=location))
+            session.commit()
+
+            # Another report date is another partition, the case ID is still taken
+            session.add(Case(id=99996, report_date=datetime.date(2016, 4, 9), location=location))
+            with self.assertRaises(IntegrityError):
+                session.commit()
+            session.rollback()
+        finally:
+            session.query(Case).filter(Case.id == 99996).delete(synchronize_session=False)
+            session.commit()
+            session.close()
+
+
     def test_load_case_correct(self):
         session = database_service.get_sqlalchemy_session()
         import_service = import_service_module.ImportService()
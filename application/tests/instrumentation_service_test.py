@@ -0,0 +1,29 @@
+import datetime
+import unittest
+
+from services import instrumentation_service
+
+
+class TestInstrumentationServiceFunctions(unittest.TestCase):
+
+    def test_instrumentation(self):
+        instrumentation = instrumentation_service.Instrumentation()
+
+        # Outside of a day nothing is recorded
+        instrumentation.count('rows_fetched', 10)
+
+        instrumentation.start_day(datetime.date(2016, 3, 25))
+        with instrumentation.timer('cluster_query'):
+            pass
+        with instrumentation.timer('cluster_query'):
+            pass
+        instrumentation.count('rows_fetched', 3)
+        instrumentation.count('rows_fetched', 4)
+        instrumentation.count('probability_cache_hits')
+        record = instrumentation.finish_day()
+
+        self.assertEqual(record['risk_date'], '2016-03-25')
+        self.assertEqual(record['rows_fetched'], 7)
+        self.assertEqual(record['probability_cache_hits'], 1)
+        self.assertGreaterEqual(record['cluster_query_seconds'], 0)
+        self.assertGreaterEqual(record['total_seconds'], record['cluster_query_seconds'])
@@ -0,0 +1,181 @@
+import datetime
+import random
+import unittest
+
+import numpy
+import shapely.geometry
+
+from models.classes.case_table import CaseTable
+from models.classes.cluster import Cluster
+from models.models import Case
+from services import geography_service
+from services import pair_count_service
+
+
+class TestPairCountServiceFunctions(unittest.TestCase):
+
+    def test_count_close_pairs(self):
+        randomizer = random.Random(42)
+        startdate = datetime.date(2016, 3, 1)
+
+        # Grid aligned coordinates, so that many pairs lie exactly at the close in space distance
+        cases = [(case_id,
+                  startdate + datetime.timedelta(days=randomizer.randint(0, 28)),
+                  shapely.geometry.Point(randomizer.randint(0, 10) * 50.0, randomizer.randint(0, 10) * 50.0))
+                 for case_id in randomizer.sample(range(10000), 150)]
+
+        expected = get_close_pairs_loop(cases, 100, 4)
+
+        for block_size in (7, 64, pair_count_service.BLOCK_SIZE):
+            result = pair_count_service.count_close_pairs([case[0] for case in cases],
+                                                          [case[2].x for case in cases],
+                                                          [case[2].y for case in cases],
+                                                          [case[1].toordinal() for case in cases],
+                                                          100,
+                                                          4,
+                                                          block_size=block_size)
+            self.assertEqual(result, expected)
+
+    def test_close_pair_graph(self):
+        randomizer = random.Random(7)
+        startdate = datetime.date(2016, 3, 1)
+
+        cases = [Case(id=case_id,
+                      report_date=startdate + datetime.timedelta(days=randomizer.randint(0, 28)),
+                      location=shapely.geometry.Point(randomizer.randint(0, 40) * 25.0,
+                                                      randomizer.randint(0, 40) * 25.0))
+                 for case_id in randomizer.sample(range(10000), 400)]
+
+        clusters = []
+        for _ in range(20):
+            cluster = Cluster()
+            cluster.cases = randomizer.sample(cases, randomizer.randint(0, 150))
+            clusters.append(cluster)
+
+        close_pair_graph, case_indices_per_cluster = pair_count_service.get_close_pair_graph_for_clusters(clusters,
+                                                                                                          100,
+                                                                                                          4)
+
+        for cluster, case_indices in zip(clusters, case_indices_per_cluster):
+            expected = pair_count_service.count_close_pairs([case.id for case in cluster.cases],
+                                                            [case.location.x for case in cluster.cases],
+                                                            [case.location.y for case in cluster.cases],
+                                                            [case.report_date.toordinal() for case in cluster.cases],
+                                                            100,
+                                                            4)
+            self.assertEqual(close_pair_graph.count_close_pairs(case_indices), expected)
+
+    def test_close_pair_graph_for_case_table(self):
+        randomizer = random.Random(11)
+        startdate = datetime.date(2016, 3, 1)
+
+        case_table = CaseTable.from_rows([(case_id,
+                                           startdate + datetime.timedelta(days=randomizer.randint(0, 28)),
+                                           randomizer.randint(0, 40) * 25.0,
+                                           randomizer.randint(0, 40) * 25.0)
+                                          for case_id in randomizer.sample(range(10000), 400)])
+
+        clusters = []
+        for _ in range(20):
+            cluster = Cluster()
+            cluster.case_table = case_table
+            cluster.case_indices = numpy.array(sorted(randomizer.sample(range(len(case_table)),
+                                                                        randomizer.randint(0, 150))),
+                                               dtype=numpy.int64)
+            clusters.append(cluster)
+
+        close_pair_graph, case_indices_per_cluster = pair_count_service.get_close_pair_graph_for_clusters(clusters,
+                                                                                                          100,
+                                                                                                          4)
+
+        for cluster, case_indices in zip(clusters, case_indices_per_cluster):
+            self.assertEqual(cluster.get_case_count(), len(cluster.cases))
+            expected = pair_count_service.count_close_pairs([case.id for case in cluster.cases],
+                                                            [case.location.x for case in cluster.cases],
+                                                            [case.location.y for case in cluster.cases],
+                                                            [case.report_date.toordinal() for case in cluster.cases],
+                                                            100,
+                                                            4)
+            self.assertEqual(close_pair_graph.count_close_pairs(case_indices), expected)
+
+    def test_use_close_pair_graph(self):
+        case_table = CaseTable.from_rows([(case_id, datetime.date(2016, 3, 1), float(case_id), 0.0)
+                                          for case_id in range(400)])
+
+        def get_clusters(cluster_count, first_indices):
+            clusters = []
+            for cluster_number in range(cluster_count):
+                cluster = Cluster()
+                cluster.case_table = case_table
+                cluster.case_indices = numpy.array(first_indices(cluster_number), dtype=numpy.int64)
+                clusters.append(cluster)
+            return clusters
+
+        size = pair_count_service.MIN_MEAN_CLUSTER_SIZE_FOR_GRAPH
+
+        # Large clusters that share their cases
+        self.assertTrue(pair_count_service.use_close_pair_graph(
+            get_clusters(10, lambda number: range(number, number + size))))
+        # Large clusters without shared cases
+        self.assertFalse(pair_count_service.use_close_pair_graph(
+            get_clusters(5, lambda number: range(number * size, (number + 1) * size))))
+        # Small clusters that share their cases
+        self.assertFalse(pair_count_service.use_close_pair_graph(
+            get_clusters(10, lambda number: range(number, number + size - 1))))
+        self.assertFalse(pair_count_service.use_close_pair_graph([]))
+
+    def test_count_close_pairs_empty(self):
+        result = pair_count_service.count_close_pairs([], [], [], [], 100, 4)
+        self.assertEqual(result, (0, 0, 0))
+
+    def test_close_pair_graph_with_repeated_ids(self):
+        randomizer = random.Random(13)
+        startdate = datetime.date(2016, 3, 1)
+
+        # Every ID is used by up to three cases, e.g. a case reported again at another date or location
+        case_table = CaseTable.from_rows([(case_id,
+                                           startdate + datetime.timedelta(days=randomizer.randint(0, 8)),
+                                           randomizer.randint(0, 20) * 25.0,
+                                           randomizer.randint(0, 20) * 25.0)
+                                          for case_id in range(100) for _ in range(randomizer.randint(1, 3))])
+
+        clusters = []
+        for _ in range(20):
+            cluster = Cluster()
+            cluster.case_table = case_table
+            cluster.case_indices = numpy.array(sorted(randomizer.sample(range(len(case_table)),
+                                                                        randomizer.randint(0, 150))),
+                                               dtype=numpy.int64)
+            clusters.append(cluster)
+
+        close_pair_graph, case_indices_per_cluster = pair_count_service.get_close_pair_graph_for_clusters(clusters,
+                                                                                                          100,
+                                                                                                          4)
+
+        for cluster, case_indices in zip(clusters, case_indices_per_cluster):
+            (ids, x, y, report_days) = cluster.get_case_columns()
+            expected = pair_count_service.count_close_pairs(ids, x, y, report_days, 100, 4)
+            self.assertEqual(close_pair_graph.count_close_pairs(case_indices), expected)
+
+    def test_count_close_in_time_with_repeated_ids(self):
+        report_days = [1, 2, 2, 5, 9]
+        ids = [1, 1, 2, 1, 2]
+
+        self.assertEqual(pair_count_service.count_close_in_time(report_days, 3), 5)
+        # Without the pairs of ID 1 at days 1 and 2, and at days 2 and 5
+        self.assertEqual(pair_count_service.count_close_in_time(report_days, 3, ids=ids), 3)
+
+
+def get_close_pairs_loop(cases, close_in_space, close_in_time):
+    close_space = 0
+    close_time = 0
+    close_space_and_time = 0
+    for (case_id, report_date, location) in cases:
+        for (nearby_case_id, nearby_report_date, nearby_location) in cases:
+            if case_id > nearby_case_id:
+                is_close_in_space = geography_service.is_within_distance(location, nearby_location, close_in_space)
+                is_close_in_time = abs((report_date - nearby_report_date).days) <= close_in_time
+                close_space += is_close_in_space
+                close_time += is_close_in_time
+                close_space_and_time += is_close_in_space and is_close_in_time
+    return close_space, close_time, close_space_and_time
@@ -0,0 +1,21 @@
+import datetime
+import unittest
+
+from services import partition_service
+
+
+class TestPartitionServiceFunctions(unittest.TestCase):
+
+    def test_get_months(self):
+        months = list(partition_service.get_months(datetime.date(2016, 11, 15), datetime.date(2017, 2, 1)))
+        self.assertEqual(months, [datetime.date(2016, 11, 1),
+                                  datetime.date(2016, 12, 1),
+                                  datetime.date(2017, 1, 1),
+                                  datetime.date(2017, 2, 1)])
+
+    def test_get_months_single_day(self):
+        months = list(partition_service.get_months(datetime.date(2016, 3, 31), datetime.date(2016, 3, 31)))
+        self.assertEqual(months, [datetime.date(2016, 3, 1)])
+
+    def test_get_partition_name(self):
+        self.assertEqual(partition_service.get_partition_name('risk', datetime.date(2016, 3, 1)), 'risk_y2016m03')
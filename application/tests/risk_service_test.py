@@ -2,11 +2,14 @@ import datetime
 import unittest
 
 from models.classes.cluster import Cluster
+from models.enums import enums
 from models.models import Case, Risk
 from services import database_service
 from services import geography_service
 from services import import_service as import_service_module
+from services import memory_cluster_service as memory_cluster_service_module
 from services import risk_service as risk_service_module
+from services import risk_writer_service
 from tests import comparative_test_service as comparative_test_service_module
 from tests import test_helper_functions
 
@@ -40,6 +43,70 @@ class TestRiskServiceFunctions(unittest.TestCase):
 
             self.assertEqual(vector_count_new, vector_count_old)
 
+    def test_get_clusters_per_point_in_memory(self):
+
+        dycast_parameters = test_helper_functions.get_dycast_parameters(large_dataset=False)
+        risk_service = risk_service_module.RiskService(dycast_parameters)
+
+        session = database_service.get_sqlalchemy_session()
+
+        riskdate = datetime.date(int(2016), int(3), int(25))
+        gridpoints = geography_service.generate_grid(dycast_parameters)
+
+        clusters_per_point_query = risk_service.get_clusters_per_point_query(session, gridpoints, riskdate)
+        clusters_per_point_sql = risk_service.get_clusters_per_point_from_query(clusters_per_point_query)
+
+        grid_x, grid_y = geography_service.generate_grid_coordinates(dycast_parameters)
+        memory_cluster_service = memory_cluster_service_module.MemoryClusterService(dycast_parameters, grid_x, grid_y)
+        clusters_per_point_memory = memory_cluster_service.get_clusters_per_point(session, riskdate)
+
+        self.assertEqual(len(clusters_per_point_memory), len(clusters_per_point_sql))
+
+        case_ids_per_point_sql = {cluster.point.wkt: sorted(case.id for case in cluster.cases)
+                                  for cluster in clusters_per_point_sql}
+        for cluster in clusters_per_point_memory:
+            case_ids = sorted(case.id for case in cluster.cases)
+            self.assertEqual(case_ids, case_ids_per_point_sql[cluster.point.wkt])
+
+    def test_get_clusters_per_point_incremental(self):
+
+        dycast_parameters = test_helper_functions.get_dycast_parameters(large_dataset=False)
+        risk_service = risk_service_module.RiskService(dycast_parameters)
+
+        session = database_service.get_sqlalchemy_session()
+
+        grid_x, grid_y = geography_service.generate_grid_coordinates(dycast_parameters)
+        memory_cluster_service = memory_cluster_service_module.MemoryClusterService(dycast_parameters, grid_x, grid_y)
+        incremental_cluster_service = memory_cluster_service_module.IncrementalClusterService(dycast_parameters,
+                                                                                              grid_x,
+                                                                                              grid_y)
+
+        riskdate = datetime.date(int(2016), int(3), int(20))
+        for day in range(10):
+            clusters_per_point_memory = memory_cluster_service.get_clusters_per_point(session, riskdate)
+            clusters_per_point_incremental = incremental_cluster_service.get_clusters_per_point(session, riskdate)
+
+            case_ids_per_point_memory = {cluster.point.wkt: sorted(case.id for case in cluster.cases)
+                                         for cluster in clusters_per_point_memory}
+            case_ids_per_point_incremental = {cluster.point.wkt: sorted(case.id for case in cluster.cases)
+                                              for cluster in clusters_per_point_incremental}
+            self.assertEqual(case_ids_per_point_incremental, case_ids_per_point_memory)
+
+            # The incremental engine keeps the close pair counts up to date itself
+            close_pairs_per_point_memory = {}
+            for cluster in clusters_per_point_memory:
+                risk_service.get_close_space_and_time_for_cluster(cluster)
+                close_pairs_per_point_memory[cluster.point.wkt] = (cluster.close_in_space,
+                                                                   cluster.close_in_time,
+                                                                   cluster.close_space_and_time)
+            close_pairs_per_point_incremental = {cluster.point.wkt: (cluster.close_in_space,
+                                                                     cluster.close_in_time,
+                                                                     cluster.close_space_and_time)
+                                                 for cluster in clusters_per_point_incremental}
+            self.assertEqual(close_pairs_per_point_incremental, close_pairs_per_point_memory)
+
+            riskdate += datetime.timedelta(days=1)
+
     def test_get_daily_cases_query_old(self):
 
         dycast_parameters = test_helper_functions.get_dycast_parameters()
@@ -86,37 +153,106 @@ class TestRiskServiceFunctions(unittest.TestCase):
         risk_count = test_helper_functions.get_count_from_table("risk")
         self.assertGreaterEqual(risk_count, 6)
 
+    def test_generate_risk_engines_agree(self):
+
+        dycast_parameters = test_helper_functions.get_dycast_parameters(large_dataset=False)
+        startdate = datetime.date(int(2016), int(3), int(24))
+        enddate = datetime.date(int(2016), int(3), int(26))
+
+        import_service = import_service_module.ImportService()
+        import_service.load_case_files(dycast_parameters)
+
+        # Every engine on the same dates
+        risk_per_engine = {}
+        for engine in (enums.Risk_engine.SQL, enums.Risk_engine.MEMORY, enums.Risk_engine.INCREMENTAL):
+            with database_service.session_scope() as session:
+                session.query(Risk).filter(Risk.risk_date >= startdate,
+                                           Risk.risk_date <= enddate) \
+                    .delete(synchronize_session=False)
+
+            dycast_parameters.engine = engine
+            risk_service = risk_service_module.RiskService(dycast_parameters)
+            daily_results = risk_service.generate_risk_for_dates(startdate, enddate, log_progress=False)
+
+            with database_service.session_scope() as session:
+                risks = session.query(Risk).filter(Risk.risk_date >= startdate,
+                                                   Risk.risk_date <= enddate)
+                risk_per_engine[engine] = {(risk.risk_date, risk.cell_id): (risk.number_of_cases,
+                                                                            risk.close_pairs,
+                                                                            risk.close_space,
+                                                                            risk.close_time,
+                                                                            risk.cumulative_probability)
+                                           for risk in risks}
+
+            self.assertEqual([daily_result.risk_date for daily_result in daily_results],
+                             [startdate + datetime.timedelta(days=day) for day in range(3)])
+            self.assertEqual(sum(daily_result.points_above_threshold for daily_result in daily_results),
+                             len(risk_per_engine[engine]))
+
+        sql_risk = risk_per_engine[enums.Risk_engine.SQL]
+        self.assertGreater(len(sql_risk), 0)
+        for engine, risk in risk_per_engine.items():
+            self.assertEqual(risk, sql_risk, engine)
+
     def test_insert_risk(self):
 
         dycast_parameters = test_helper_functions.get_dycast_parameters()
         risk_service = risk_service_module.RiskService(dycast_parameters)
         session = database_service.get_sqlalchemy_session()
 
-        gridpoints = geography_service.generate_grid(dycast_parameters)
-        point = geography_service.get_shape_from_sqlalch_element(gridpoints[0])
+        cell_ids = test_helper_functions.get_test_cell_ids(session, dycast_parameters)
 
         risk = Risk(risk_date=datetime.date(int(2016), int(3), int(25)),
+                    cell_id=int(cell_ids[0]),
                     number_of_cases=5,
-                    lat=point.x,
-                    long=point.y,
                     close_pairs=3,
                     close_space=2,
                     close_time=1,
                     cumulative_probability=0.032)
 
         session.query(Risk.risk_date).filter(Risk.risk_date == risk.risk_date,
-                                             Risk.lat == risk.lat,
-                                             Risk.long == risk.long) \
+                                             Risk.cell_id == risk.cell_id) \
             .delete()
 
         risk_service.insert_risk(session, risk)
         session.commit()
 
         session.query(Risk.risk_date).filter(Risk.risk_date == risk.risk_date,
-                                             Risk.lat == risk.lat,
-                                             Risk.long == risk.long) \
+                                             Risk.cell_id == risk.cell_id) \
             .one()
 
+    def test_risk_writer(self):
+
+        dycast_parameters = test_helper_functions.get_dycast_parameters()
+        session = database_service.get_sqlalchemy_session()
+
+        cell_ids = test_helper_functions.get_test_cell_ids(session, dycast_parameters)
+        risk_date = datetime.date(int(2016), int(3), int(26))
+
+        risks = []
+        for cell_id in cell_ids[:3]:
+            risks.append(Risk(risk_date=risk_date,
+                              cell_id=int(cell_id),
+                              number_of_cases=5,
+                              close_pairs=3,
+                              close_space=2,
+                              close_time=1,
+                              cumulative_probability=0.032))
+
+        for risk in risks:
+            session.query(Risk.risk_date).filter(Risk.risk_date == risk.risk_date,
+                                                 Risk.cell_id == risk.cell_id) \
+                .delete()
+        session.commit()
+
+        risk_writer = risk_writer_service.RiskWriter(session, batch_size=2)
+        for risk in risks + risks[:1]:
+            risk_writer.add(risk)
+        risk_writer.close()
+
+        self.assertEqual(risk_writer.rows_written, 3)
+        self.assertEqual(risk_writer.rows_skipped, 1)
+
     def test_get_close_space_and_time_old(self):
 
         dycast_parameters = test_helper_functions.get_dycast_parameters()
@@ -302,8 +438,48 @@ class TestRiskServiceFunctions(unittest.TestCase):
 
         self.assertGreater(cluster.cumulative_probability, 0)
 
+    def test_get_cumulative_probability_from_distribution_margin_table(self):
+
+        dycast_parameters = test_helper_functions.get_dycast_parameters()
+        risk_service = risk_service_module.RiskService(dycast_parameters)
+        session = database_service.get_sqlalchemy_session()
+
+        distribution_margin_table = risk_service.get_distribution_margin_table(session)
+        self.assertGreater(len(distribution_margin_table), 0)
+        self.assertGreater(distribution_margin_table.get_memory_footprint(), 0)
+
+        for (case_count, close_space_and_time, close_in_space, close_in_time) in [(2, 1, 1, 1),
+                                                                                  (10, 3, 5, 27),
+                                                                                  (30, 1, 2, 10),
+                                                                                  (1000, 1, 1, 1)]:
+            cluster = Cluster()
+            cluster.case_count = case_count
+            cluster.close_space_and_time = close_space_and_time
+            cluster.close_in_space = close_in_space
+            cluster.close_in_time = close_in_time
+
+            risk_service.distribution_margin_table = None
+            risk_service.get_cumulative_probability_for_cluster(session, cluster)
+            cumulative_probability_database = cluster.cumulative_probability
+
+            risk_service.distribution_margin_table = distribution_margin_table
+            risk_service.get_cumulative_probability_for_cluster(session, cluster)
+
+            self.assertEqual(cluster.cumulative_probability, cumulative_probability_database)
+
     def test_can_get_cases(self):
         session = database_service.get_sqlalchemy_session()
         cases = session.query(Case.id).all()
         case_count = len(cases)
         self.assertGreater(case_count, 0)
+
+    def test_get_date_ranges(self):
+        startdate = datetime.date(2016, 3, 1)
+        enddate = datetime.date(2016, 3, 10)
+
+        date_ranges = risk_service_module.get_date_ranges(startdate, enddate, 3)
+
+        self.assertEqual(date_ranges, [(datetime.date(2016, 3, 1), datetime.date(2016, 3, 4)),
+                                       (datetime.date(2016, 3, 5), datetime.date(2016, 3, 7)),
+                                       (datetime.date(2016, 3, 8), datetime.date(2016, 3, 10))])
+        self.assertEqual(len(risk_service_module.get_date_ranges(startdate, startdate, 4)), 1)
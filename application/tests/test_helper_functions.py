@@ -10,6 +10,8 @@ from services import logging_service
 from services import debug_service
 from services import conversion_service
 from services import database_service
+from services import geography_service
+from services import grid_service
 from models.classes import dycast_parameters
 from models.models import Case
 
@@ -101,11 +103,28 @@ def get_count_from_table(table_name):
     new_row = cur.fetchone()
     return new_row[0]
 
+@nottest
+def get_test_cell_ids(session, dycast):
+    """
+    Stores the grid of the dycast parameters in the grid_points table, if needed,
+    and returns the cell IDs of its gridpoints
+    """
+    grid_x, grid_y = geography_service.generate_grid_coordinates(dycast)
+    grid_key = grid_service.get_grid_key(dycast)
+    grid_service.init_grid_table(session, grid_key, grid_x, grid_y, geography_service.get_grid_row_count(dycast))
+    return grid_service.get_cell_ids(session, grid_key)
+
 @nottest
 def insert_test_risk():
+    session = database_service.get_sqlalchemy_session()
+    try:
+        cell_id = int(get_test_cell_ids(session, get_dycast_parameters())[0])
+    finally:
+        session.close()
+
     cur, conn = database_service.init_psycopg_db()
-    querystring = "INSERT INTO risk VALUES %s"
-    data_tuple = [('2016-03-30', 1830400, 2120400, 10, 1, 6, 7, 0.3946), ('2016-03-31', 1830400, 2120400, 10, 1, 6, 7, 0.3946)]
+    querystring = "INSERT INTO risk (risk_date, cell_id, number_of_cases, close_pairs, close_space, close_time, cumulative_probability) VALUES %s"
+    data_tuple = [('2016-03-30', cell_id, 10, 1, 6, 7, 0.3946), ('2016-03-31', cell_id, 10, 1, 6, 7, 0.3946)]
     try:
         psycop_extras.execute_values(cur, querystring, data_tuple)
     except psycopg2.IntegrityError: